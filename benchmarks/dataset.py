@@ -0,0 +1,93 @@
+"""Synthetic OBHonestyData spreadsheets.
+
+The values are what values_batch_get returns for each worksheet: a header
+row followed by rows of strings. Orders are in time order over the last
+year, with a day's worth of sign-ups for today.
+"""
+from datetime import datetime, timedelta
+import random
+from typing import Dict, List
+
+from obhonesty.constants import (
+  breakfast_items, item_headers, order_headers, tax_categories, user_headers
+)
+
+diets = ["Vegan", "Vegetarian", "Meat"]
+
+def users(count: int, rng: random.Random) -> List[List[str]]:
+  return [
+    [
+      f"user{i:06}", f"First{i}", f"Last{i % 997}", f"+45 {i:08}",
+      f"user{i}@example.com", f"Street {i}",
+      "yes" if rng.random() < 0.1 else "no",
+      "no", rng.choice(diets), rng.choice(["", "", "", "nuts"]), ""
+    ]
+    for i in range(count)
+  ]
+
+def items(count: int, rng: random.Random) -> List[List[str]]:
+  return [
+    [
+      f"Item {i}", f"{rng.randrange(50, 1500) / 100:.2f}",
+      f"Description of item {i}", rng.choice(tax_categories)
+    ]
+    for i in range(count)
+  ]
+
+def orders(
+  count: int, nick_names: List[str], menu: List[List[str]], rng: random.Random
+) -> List[List[str]]:
+  now = datetime.now()
+  # The last rows are today's, about as many as the rest has per day
+  today = min(count, max(10, count // 365))
+  start = now - timedelta(days=365)
+  step = (now - start) / max(count - today, 1)
+  midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+  rows = []
+  for i in range(count):
+    if i < count - today:
+      time = start + step * i
+    else:
+      time = midnight + (now - midnight) * ((i - count + today) / today)
+    user = rng.choice(nick_names)
+    kind = rng.random()
+    if kind < 0.15:
+      rows.append([
+        f"order-{i}", user, str(time), "Dinner sign-up", "1", "12", "12",
+        f"Guest of {user}", rng.choice(diets), "", "",
+        "Food and beverage non-alcoholic", ""
+      ])
+    elif kind < 0.3:
+      rows.append([
+        f"order-{i}", user, str(time), "Breakfast sign-up", "1", "6", "6",
+        f"Guest of {user}", rng.choice(breakfast_items), "", "",
+        "Food and beverage non-alcoholic", ""
+      ])
+    else:
+      name, price, _, category = rng.choice(menu)
+      quantity = rng.choice(["1", "1", "1", "2", "3"])
+      rows.append([
+        f"order-{i}", user, str(time), name, quantity, price,
+        f"{float(price) * int(quantity):.2f}", "", "", "", "", category, ""
+      ])
+  return rows
+
+def dataset(order_count: int, seed: int = 0) -> Dict[str, List[List[str]]]:
+  """Worksheet values by title, with about one user per hundred orders."""
+  rng = random.Random(seed)
+  user_rows = users(max(20, order_count // 100), rng)
+  item_rows = items(40, rng)
+  admin_header = [
+    "dinner_price", "dinner_signup_deadline", "breakfast_signup_deadline"
+  ] + [f"{x}_price" for x in breakfast_items]
+  return {
+    "users": [user_headers] + user_rows,
+    "items": [item_headers] + item_rows,
+    "orders": [order_headers] + orders(
+      order_count, [x[0] for x in user_rows], item_rows, rng
+    ),
+    "admin": [
+      admin_header,
+      ["12", "14:00", "21:00"] + ["6"] * len(breakfast_items)
+    ]
+  }
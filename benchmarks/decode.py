@@ -0,0 +1,115 @@
+"""Rows per second decoded from worksheet values.
+
+Compares building models from one dict per row, as the sheet reloads used
+to, with RowDecoder and the order store.
+
+Run from the repository root: python -m benchmarks.decode [rows]
+"""
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from obhonesty.aux import safe_datetime_convert, safe_float_convert, value_or
+from obhonesty.constants import item_headers, order_headers, user_headers
+from obhonesty.decode import RowDecoder, item_fields, order_fields, user_fields
+from obhonesty.item import Item
+from obhonesty.order import Order
+from obhonesty.order_store import OrderStore
+from obhonesty.user import User
+
+def order_rows(count: int) -> List[List[str]]:
+  return [
+    [
+      f"order-{i}", f"user-{i % 200}", f"2024-{i % 12 + 1:02}-01 12:00:00",
+      f"item-{i % 40}", "1", "2.5", "2.5", "", "", "", "", "food", ""
+    ]
+    for i in range(count)
+  ]
+
+def user_rows(count: int) -> List[List[str]]:
+  return [
+    [f"user-{i}", "First", "Last", "", "", "", "no", "no", "Vegan", "", "0"]
+    for i in range(count)
+  ]
+
+def item_rows(count: int) -> List[List[str]]:
+  return [[f"item-{i}", "2.5", "", "food"] for i in range(count)]
+
+def records(header: List[str], rows: List[List[str]]) -> List[Dict[str, str]]:
+  return [dict(zip(header, x)) for x in rows]
+
+def order_from_dict(x: Dict[str, str]) -> Order:
+  return Order(
+    order_id=x['order_id'],
+    user_nick_name=x['user'],
+    time=x['time'],
+    item=x['item'],
+    quantity=value_or(safe_float_convert(x['quantity']), 1.0),
+    price=value_or(safe_float_convert(x['price']), 0.0),
+    total=value_or(safe_float_convert(x['total']), 0.0),
+    receiver=x['receiver'],
+    diet=x['diet'],
+    allergies=x['allergies'],
+    served=x['served'],
+    tax_category=x['tax_category'],
+    comment=x['comment'],
+    timestamp=safe_datetime_convert(x['time'])
+  )
+
+def user_from_dict(x: Dict[str, str]) -> User:
+  return User(
+    nick_name=x['nick_name'],
+    first_name=x['first_name'],
+    last_name=x['last_name'],
+    email=x['email'],
+    phone_number=x['phone_number'],
+    address=x['address'],
+    volunteer=x['volunteer'] == 'yes',
+    away=x['away'] == 'yes',
+    diet=x['diet'],
+    allergies=x['allergies'],
+    owes=value_or(safe_float_convert(x['owes']), 0.0)
+  )
+
+def item_from_dict(x: Dict[str, str]) -> Item:
+  return Item(
+    name=x['name'],
+    price=value_or(safe_float_convert(x['price']), 0.0),
+    description=x['description'],
+    tax_category=x['tax_category']
+  )
+
+def rate(decode: Callable[[], Any], count: int) -> float:
+  start = time.perf_counter()
+  decode()
+  return count / (time.perf_counter() - start)
+
+def main(count: int):
+  cases = [
+    ("orders", order_headers, order_rows(count), Order, order_from_dict,
+      order_fields),
+    ("users", user_headers, user_rows(count), User, user_from_dict,
+      user_fields),
+    ("items", item_headers, item_rows(count), Item, item_from_dict,
+      item_fields)
+  ]
+  print(f"{'rows':<8}{'dicts':>14}{'RowDecoder':>14}{'speedup':>10}")
+  for title, header, rows, model, from_dict, fields in cases:
+    before = rate(
+      lambda: [from_dict(x) for x in records(header, rows)], count
+    )
+    after = rate(
+      lambda: RowDecoder(title, header, fields).decode(model, rows), count
+    )
+    print(f"{title:<8}{before:>14,.0f}{after:>14,.0f}{after / before:>9.1f}x")
+  stored = rate(
+    lambda: OrderStore(
+      RowDecoder("orders", order_headers, order_fields).values(cases[0][2])
+    ),
+    count
+  )
+  print(f"{'store':<8}{'':>14}{stored:>14,.0f}")
+
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,283 @@
+"""An in-memory stand-in for the gspread spreadsheet the app talks to.
+
+It implements the calls obhonesty.sheet makes (values_batch_get,
+batch_update, get_lastUpdateTime, worksheet, add_worksheet and the
+worksheets' append_rows),
+plus append_row, get_all_values and get_all_records. Values are kept as
+the strings Google would return; read unformatted, those that look like
+numbers come as numbers.
+
+Every call waits a configurable latency and can fail like Google does:
+quota errors (429) once the per-minute read or write quota is used up,
+random server errors and dropped connections, or the failures queued with
+Faults.fail_next. Install it in place of the real spreadsheet with
+install().
+"""
+from collections import deque
+from dataclasses import dataclass, field
+import json
+import random
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, numericise_all
+import requests
+from requests.exceptions import ConnectionError
+
+from obhonesty.sheet import sheets
+
+def api_error(code: int, message: str) -> APIError:
+  """The error gspread raises for a response with the given status."""
+  response = requests.Response()
+  response.status_code = code
+  response._content = json.dumps(
+    {"error": {"code": code, "message": message, "status": ""}}
+  ).encode()
+  return APIError(response)
+
+def cell(value: Any) -> str:
+  if isinstance(value, float) and value.is_integer():
+    return str(int(value))
+  return str(value)
+
+def paste(rows: List[List[str]], top: int, left: int, values: List[List[str]]):
+  """Writes the values into the rows, from the given cell on."""
+  for i, row in enumerate(values):
+    while len(rows) <= top + i:
+      rows.append([])
+    target = rows[top + i]
+    if len(target) < left + len(row):
+      target.extend([""] * (left + len(row) - len(target)))
+    target[left:left + len(row)] = row
+
+def row_values(rows: List[Dict[str, Any]]) -> List[List[str]]:
+  """The values of the rows of a batch update request."""
+  return [
+    [cell(next(iter(x["userEnteredValue"].values()))) for x in row["values"]]
+    for row in rows
+  ]
+
+def trim(row: List[str]) -> List[str]:
+  """The row without trailing empty cells, as Google returns it."""
+  end = len(row)
+  while end > 0 and row[end - 1] == "":
+    end -= 1
+  return row[:end]
+
+
+@dataclass
+class Faults:
+  """What every call to the fake waits for and how it fails.
+
+  Quotas are calls per minute, None for no limit. The error and connection
+  error rates are the chances that a call fails outright. fail_next holds
+  status codes, or 0 for a dropped connection, that the next calls fail
+  with, one each, before anything else is considered.
+  """
+  latency: float = 0.0
+  jitter: float = 0.0
+  reads_per_minute: Optional[int] = None
+  writes_per_minute: Optional[int] = None
+  error_rate: float = 0.0
+  connection_error_rate: float = 0.0
+  fail_next: Deque[int] = field(default_factory=deque)
+  seed: Optional[int] = None
+
+  def __post_init__(self):
+    self.rng = random.Random(self.seed)
+    self.lock = threading.Lock()
+    self.calls: Dict[bool, Deque[float]] = {False: deque(), True: deque()}
+    self.counters: Dict[str, int] = {
+      "reads": 0, "writes": 0, "quota_errors": 0, "errors": 0,
+      "connection_errors": 0
+    }
+
+  def check(self, write: bool):
+    """Waits the latency, then raises the failure due for this call."""
+    with self.lock:
+      self.counters["writes" if write else "reads"] += 1
+      delay = self.latency + self.rng.uniform(0, self.jitter)
+      code = self.fail_next.popleft() if self.fail_next else None
+      if code is None:
+        code = self.quota(write, time.monotonic())
+      if code is None:
+        draw = self.rng.random()
+        if draw < self.connection_error_rate:
+          code = 0
+        elif draw < self.connection_error_rate + self.error_rate:
+          code = self.rng.choice([500, 503])
+    if delay > 0:
+      time.sleep(delay)
+    if code is None:
+      return
+    if code == 0:
+      self.count("connection_errors")
+      raise ConnectionError("Connection dropped by the fake spreadsheet")
+    self.count("quota_errors" if code == 429 else "errors")
+    raise api_error(code, f"Fake spreadsheet failure {code}")
+
+  def quota(self, write: bool, now: float) -> Optional[int]:
+    limit = self.writes_per_minute if write else self.reads_per_minute
+    if limit is None:
+      return None
+    calls = self.calls[write]
+    while calls and now - calls[0] >= 60.0:
+      calls.popleft()
+    if len(calls) >= limit:
+      return 429
+    calls.append(now)
+    return None
+
+  def count(self, name: str):
+    with self.lock:
+      self.counters[name] += 1
+
+
+class FakeWorksheet:
+
+  def __init__(self, spreadsheet: "FakeSpreadsheet", title: str):
+    self.spreadsheet = spreadsheet
+    self.title = title
+
+  @property
+  def id(self) -> int:
+    return self.spreadsheet.ids[self.title]
+
+  @property
+  def rows(self) -> List[List[str]]:
+    return self.spreadsheet.data[self.title]
+
+  def get_all_values(self) -> List[List[str]]:
+    self.spreadsheet.faults.check(False)
+    with self.spreadsheet.lock:
+      return [trim(x) for x in self.rows]
+
+  def get_all_records(self) -> List[Dict[str, str]]:
+    values = self.get_all_values()
+    if not values:
+      return []
+    header = values[0]
+    return [
+      {x: row[i] if i < len(row) else "" for i, x in enumerate(header)}
+      for row in values[1:]
+    ]
+
+  def append_row(self, values: List[Any], **kwargs):
+    self.append_rows([values], **kwargs)
+
+  def append_rows(self, values: List[List[Any]], **kwargs):
+    self.spreadsheet.faults.check(True)
+    with self.spreadsheet.lock:
+      self.rows.extend([cell(x) for x in row] for row in values)
+      self.spreadsheet.modified()
+
+
+class FakeSpreadsheet:
+  """Worksheets by title, each a list of rows of strings."""
+
+  def __init__(self, data: Dict[str, List[List[Any]]], faults: Faults):
+    self.data = {
+      title: [[cell(x) for x in row] for row in rows]
+      for title, rows in data.items()
+    }
+    self.ids = {title: i for i, title in enumerate(self.data)}
+    self.faults = faults
+    self.lock = threading.Lock()
+    self.last_update = time.time()
+
+  def modified(self):
+    """Records a change; call it holding the lock."""
+    self.last_update = time.time()
+
+  def get_lastUpdateTime(self) -> str:
+    self.faults.check(False)
+    with self.lock:
+      seconds = self.last_update
+    return time.strftime(
+      "%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)
+    ) + f".{int(seconds % 1 * 1000):03d}Z"
+
+  def worksheet(self, title: str) -> FakeWorksheet:
+    self.faults.check(False)
+    if title not in self.data:
+      raise WorksheetNotFound(title)
+    return FakeWorksheet(self, title)
+
+  def add_worksheet(self, title: str, rows: int, cols: int) -> FakeWorksheet:
+    self.faults.check(True)
+    with self.lock:
+      if title in self.data:
+        raise api_error(400, f"A sheet with the name {title} already exists")
+      self.data[title] = []
+      self.ids[title] = max(self.ids.values(), default=-1) + 1
+      self.modified()
+    return FakeWorksheet(self, title)
+
+  def values_get(self, range_name: str) -> Dict[str, Any]:
+    title, _, a1 = range_name.partition("!")
+    rows = self.data[title]
+    grid = a1_range_to_grid_range(a1) if a1 else {}
+    top = grid.get("startRowIndex", 0)
+    bottom = grid.get("endRowIndex", len(rows))
+    left = grid.get("startColumnIndex", 0)
+    right = grid.get("endColumnIndex")
+    values = [trim(x[left:right]) for x in rows[top:bottom]]
+    while values and not values[-1]:
+      values.pop()
+    result: Dict[str, Any] = {"range": range_name, "majorDimension": "ROWS"}
+    if values:
+      result["values"] = values
+    return result
+
+  def values_batch_get(
+    self, ranges: List[str], params: Optional[Dict[str, Any]] = None
+  ) -> Dict[str, Any]:
+    self.faults.check(False)
+    with self.lock:
+      value_ranges = [self.values_get(x) for x in ranges]
+    if (params or {}).get("valueRenderOption") == "UNFORMATTED_VALUE":
+      for x in value_ranges:
+        if "values" in x:
+          x["values"] = [numericise_all(row) for row in x["values"]]
+    return {"valueRanges": value_ranges}
+
+  def batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Applies the appendCells, updateCells and deleteDimension requests,
+    all of them or none."""
+    self.faults.check(True)
+    with self.lock:
+      titles = {id: title for title, id in self.ids.items()}
+      data = {
+        title: [list(x) for x in rows] for title, rows in self.data.items()
+      }
+      for request in body["requests"]:
+        (kind, spec), = request.items()
+        if kind == "appendCells":
+          data[titles[spec["sheetId"]]].extend(row_values(spec["rows"]))
+        elif kind == "updateCells":
+          grid = spec["range"]
+          paste(
+            data[titles[grid["sheetId"]]], grid.get("startRowIndex", 0),
+            grid.get("startColumnIndex", 0), row_values(spec["rows"])
+          )
+        elif kind == "deleteDimension":
+          grid = spec["range"]
+          del data[titles[grid["sheetId"]]][grid["startIndex"]:grid["endIndex"]]
+        else:
+          raise api_error(400, f"Unsupported request {kind}")
+      self.data = data
+      self.modified()
+    return {"replies": [{} for _ in body["requests"]]}
+
+
+def install(
+  data: Dict[str, List[List[Any]]], faults: Optional[Faults] = None
+) -> FakeSpreadsheet:
+  """Makes the app's sheets talk to a fake spreadsheet holding the data."""
+  spreadsheet = FakeSpreadsheet(data, faults or Faults())
+  with sheets.lock:
+    sheets.spreadsheet = spreadsheet
+    sheets.worksheets = {}
+  return spreadsheet
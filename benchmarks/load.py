@@ -0,0 +1,235 @@
+"""Load-tests the app's event handlers against a fake spreadsheet.
+
+Run from the repository root:
+
+  python -m benchmarks.load [--kiosks 10 50 200] [--sessions 5]
+    [--latency 0.3] [--reads-per-minute 300] [--error-rate 0.01]
+
+The app is imported as the server would import it, but the spreadsheet is
+the in-memory fake of benchmarks.fake_gspread, holding a synthetic
+spreadsheet of --orders orders. Each kiosk connects and then runs sessions
+the way a guest uses the welcome page: the page loads, they pick
+themselves, order an item and sometimes sign up for dinner. Events go
+through the same processing as the socket's, including the background
+tasks and the serialized updates, only the socket itself is left out.
+
+For every number of concurrent kiosks, the p50 and p99 latency of each
+handler and the events and sessions per second are printed and written to
+benchmarks/load.json unless --output says otherwise.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+import uuid
+
+# Keep the app's order journal out of the measurements
+os.environ.setdefault(
+  "OBHONESTY_JOURNAL", os.path.join(tempfile.mkdtemp(), "journal.db")
+)
+
+import reflex as rx
+from reflex.app import App, process
+from reflex.event import Event, get_hydrate_event
+from reflex.utils import prerequisites
+
+from benchmarks.dataset import dataset
+from benchmarks.fake_gspread import Faults, install
+from benchmarks.suite import revision
+from obhonesty.repository import snapshot_cache
+from obhonesty.sheet import sheets
+from obhonesty.state import State
+
+def percentile(values: List[float], q: float) -> float:
+  """The nearest-rank percentile of the values."""
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Socket:
+  """Takes the place of the app's socket namespace.
+
+  Updates are serialized as they would be for sending, and counted.
+  """
+
+  def __init__(self):
+    self.sid_to_token: Dict[str, str] = {}
+    self.updates = 0
+    self.bytes = 0
+
+  async def emit_update(self, update: Any, sid: str):
+    self.updates += 1
+    self.bytes += len(update.json())
+
+  async def emit(self, *args, **kwargs):
+    pass
+
+
+class Kiosk:
+  """One browser tab on the welcome page, sending events one at a time."""
+
+  def __init__(self, load: "LoadTest", number: int):
+    self.load = load
+    self.token = str(uuid.uuid4())
+    self.sid = f"kiosk-{number}"
+    load.socket.sid_to_token[self.sid] = self.token
+
+  async def send(self, page: str, name: str, **payload):
+    event = Event(
+      token=self.token,
+      name=name if "." in name else f"{State.get_full_name()}.{name}",
+      router_data={"pathname": page, "asPath": page, "query": {}},
+      payload=payload
+    )
+    start = time.perf_counter()
+    updates = process(self.load.app, event, self.sid, {}, "127.0.0.1")
+    async for update in updates:
+      await self.load.socket.emit_update(update, self.sid)
+    task = self.load.tasks.pop(self.token, None)
+    if task is not None:
+      await task
+    self.load.record(name.rpartition(".")[2], time.perf_counter() - start)
+
+  async def session(self, rng: random.Random):
+    await self.send("/", "reload_sheet_data")
+    snapshot = snapshot_cache.current()
+    await self.send(
+      "/", "redirect_to_user_page", nick_name=rng.choice(snapshot.users).nick_name
+    )
+    await self.send("/user", "order_item", form_data={
+      "item_name": rng.choice(list(snapshot.items)),
+      "quantity": rng.choice(["1", "1", "2"])
+    })
+    if rng.random() < self.load.dinner_rate:
+      await self.send("/dinner", "order_dinner", form_data={
+        "first_name": "Guest", "last_name": self.sid, "diet": "Vegan",
+        "allergies": ""
+      })
+
+
+class LoadTest:
+  """Runs kiosks concurrently through the app and collects latencies."""
+
+  def __init__(self, app: App, dinner_rate: float, think: float):
+    self.app = app
+    self.dinner_rate = dinner_rate
+    self.think = think
+    self.socket = Socket()
+    self.tasks: Dict[str, asyncio.Task] = {}
+    self.latencies: Dict[str, List[float]] = {}
+    # Compiling the pages would set up the state manager and the socket
+    app._enable_state()
+    app._event_namespace = self.socket
+    # Keep the background task each event starts, to wait for it
+    process_background = app._process_background
+    def track(state: rx.State, event: Event):
+      task = process_background(state, event)
+      if task is not None:
+        self.tasks[event.token] = task
+      return task
+    app._process_background = track
+
+  def record(self, handler: str, seconds: float):
+    self.latencies.setdefault(handler, []).append(seconds)
+
+  async def kiosk(self, number: int, sessions: int, seed: int):
+    rng = random.Random(seed)
+    kiosk = Kiosk(self, number)
+    await kiosk.send("/", get_hydrate_event(rx.State))
+    for _ in range(sessions):
+      await kiosk.session(rng)
+      if self.think > 0:
+        await asyncio.sleep(rng.uniform(0, 2 * self.think))
+
+  async def run_all(
+    self, levels: List[int], sessions: int
+  ) -> List[Dict[str, Any]]:
+    results = []
+    for kiosks in levels:
+      print(f"Load testing {kiosks} kiosks")
+      results.append(await self.run(kiosks, sessions))
+      print(json.dumps(results[-1], indent=2))
+    return results
+
+  async def run(self, kiosks: int, sessions: int) -> Dict[str, Any]:
+    self.latencies = {}
+    updates, sent = self.socket.updates, self.socket.bytes
+    start = time.perf_counter()
+    await asyncio.gather(
+      *(self.kiosk(i, sessions, i) for i in range(kiosks))
+    )
+    seconds = time.perf_counter() - start
+    events = sum(len(x) for x in self.latencies.values())
+    everything = [x for values in self.latencies.values() for x in values]
+    return {
+      "kiosks": kiosks,
+      "sessions": kiosks * sessions,
+      "seconds": seconds,
+      "events_per_second": events / seconds,
+      "sessions_per_second": kiosks * sessions / seconds,
+      "updates": self.socket.updates - updates,
+      "update_bytes": self.socket.bytes - sent,
+      "latency_seconds": {
+        name: {
+          "count": len(values),
+          "p50": percentile(values, 50),
+          "p99": percentile(values, 99)
+        }
+        for name, values in [("all", everything), *self.latencies.items()]
+      }
+    }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--kiosks", type=int, nargs="+", default=[10, 50, 200])
+  parser.add_argument("--sessions", type=int, default=5)
+  parser.add_argument("--orders", type=int, default=10_000)
+  parser.add_argument("--dinner-rate", type=float, default=0.2)
+  parser.add_argument("--think", type=float, default=0.0)
+  parser.add_argument("--latency", type=float, default=0.3)
+  parser.add_argument("--jitter", type=float, default=0.2)
+  parser.add_argument("--reads-per-minute", type=int)
+  parser.add_argument("--writes-per-minute", type=int)
+  parser.add_argument("--error-rate", type=float, default=0.0)
+  parser.add_argument("--connection-error-rate", type=float, default=0.0)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument(
+    "--output", default=os.path.join("benchmarks", "load.json")
+  )
+  args = parser.parse_args()
+  faults = Faults(
+    latency=args.latency,
+    jitter=args.jitter,
+    reads_per_minute=args.reads_per_minute,
+    writes_per_minute=args.writes_per_minute,
+    error_rate=args.error_rate,
+    connection_error_rate=args.connection_error_rate,
+    seed=args.seed
+  )
+  install(dataset(args.orders, args.seed), faults)
+  # Imported like the server does, after the fake is in place
+  app = prerequisites.get_and_validate_app().app
+  load = LoadTest(app, args.dinner_rate, args.think)
+  results = asyncio.run(load.run_all(args.kiosks, args.sessions))
+  with open(args.output, "w") as f:
+    json.dump({
+      "revision": revision(),
+      "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "arguments": vars(args),
+      "spreadsheet_calls": faults.counters,
+      "sheets_counters": sheets.counters,
+      "results": results
+    }, f, indent=2)
+  print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,168 @@
+"""Times reload decoding, the page projections and their payload size.
+
+Run from the repository root:
+
+  python -m benchmarks.suite [--sizes 1000 100000 1000000] [--output FILE]
+
+Each size gets a synthetic spreadsheet (see benchmarks.dataset). Timings
+are the median and minimum of --repeat runs, in seconds; payloads are the
+bytes of the vars each page is sent, as JSON. Results are written to
+benchmarks/results.json unless --output says otherwise.
+"""
+import argparse
+from datetime import date
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+# Keep the app's order journal out of the measurements
+os.environ.setdefault(
+  "OBHONESTY_JOURNAL", os.path.join(tempfile.mkdtemp(), "journal.db")
+)
+
+from gspread.utils import numericise_all
+import reflex as rx
+
+from benchmarks.dataset import dataset
+from obhonesty.decode import item_fields, user_fields
+from obhonesty.item import Item
+from obhonesty.report import OrderColumns
+from obhonesty.repository import OrderSync, SheetRepository, snapshot_cache
+from obhonesty.roster import DinnerRoster, breakfast_signups
+from obhonesty.search import user_search
+from obhonesty.snapshot import Snapshot
+from obhonesty.state import load_session_data, user_debt, user_order_page
+from obhonesty.user import User
+
+pages = ["/", "/info", "/admin/user", "/admin/dinner", "/admin/breakfast"]
+
+def timed(run: Callable[[], Any], repeat: int) -> Dict[str, float]:
+  times: List[float] = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    run()
+    times.append(time.perf_counter() - start)
+  return {"median": statistics.median(times), "min": min(times)}
+
+def load(values: Dict[str, List[List[str]]]) -> Snapshot:
+  """Decodes the worksheets like a full sheet reload, without the network."""
+  sheet = SheetRepository()
+  order_sync = OrderSync()
+  order_sync.apply([values["orders"]])
+  return Snapshot(
+    users=sorted(
+      sheet.decode("users", values["users"], user_fields, User),
+      key=lambda x: x.nick_name
+    ),
+    items={
+      x.name : x
+      for x in sheet.decode("items", values["items"], item_fields, Item)
+    },
+    store=order_sync.store,
+    admin_data=dict(
+      zip(values["admin"][0], numericise_all(values["admin"][1]))
+    ),
+    user_index=order_sync.user_index,
+    day_index=order_sync.day_index
+  )
+
+def payload(data: Any) -> int:
+  return len(json.dumps(
+    data, default=lambda x: x.dict() if isinstance(x, rx.Base) else str(x)
+  ))
+
+def store_bytes(snapshot: Snapshot) -> int:
+  """Bytes held by the order store's arrays and strings."""
+  store = snapshot.order_store()
+  arrays = [
+    store.quantities, store.prices, store.totals, store.timestamps,
+    *store.text.values()
+  ]
+  return sum(x.itemsize * len(x) for x in arrays) + \
+    sum(sys.getsizeof(x) for x in store.strings + store.order_ids)
+
+def run(order_count: int, repeat: int) -> Dict[str, Any]:
+  values = dataset(order_count)
+  decode = timed(lambda: load(values), repeat)
+  snapshot = load(values)
+  snapshot_cache.fetch = lambda: snapshot
+  snapshot_cache.get(force=True)
+  today = date.today()
+  nick_name = max(
+    (x.nick_name for x in snapshot.users), key=snapshot.user_order_count
+  )
+  projections = {
+    "current_user_orders": lambda: user_order_page(snapshot, nick_name, 0),
+    "get_user_debt": lambda: user_debt(snapshot, nick_name),
+    "dinner_signups": lambda: DinnerRoster.build(snapshot, today),
+    "breakfast_signups": lambda: breakfast_signups(snapshot, today),
+    "tax_columns": lambda: OrderColumns(snapshot.order_store()),
+    "tax_categories": lambda: OrderColumns(snapshot.order_store()).report(
+      today.replace(day=1), today, "month"
+    ),
+    "user_search": lambda: user_search.search("user00"),
+  }
+  rows, _ = OrderColumns(snapshot.order_store()).report(
+    date(today.year - 1, today.month, 1), today, "month"
+  )
+  payloads = {
+    x: payload(load_session_data(False, x, nick_name, "", 0, 0))
+    for x in pages
+  }
+  payloads["/admin/tax"] = payload(rows)
+  return {
+    "orders": order_count,
+    "users": len(snapshot.users),
+    "items": len(snapshot.items),
+    "decode_seconds": decode,
+    "decode_rows_per_second": order_count / decode["median"],
+    "projection_seconds": {
+      x: timed(projection, repeat) for x, projection in projections.items()
+    },
+    "payload_bytes": payloads,
+    "order_store_bytes": store_bytes(snapshot)
+  }
+
+def revision() -> str:
+  try:
+    return subprocess.run(
+      ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return ""
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+    "--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+  )
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument(
+    "--output", default=os.path.join("benchmarks", "results.json")
+  )
+  args = parser.parse_args()
+  results = []
+  for size in args.sizes:
+    print(f"Benchmarking {size:,} orders")
+    results.append(run(size, args.repeat))
+    print(json.dumps(results[-1], indent=2))
+  with open(args.output, "w") as f:
+    json.dump({
+      "revision": revision(),
+      "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "repeat": args.repeat,
+      "results": results
+    }, f, indent=2)
+  print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Optional
 from reflex.vars import NumberVar, var_operation, var_operation_return
 
@@ -17,5 +18,13 @@ def safe_float_convert(s: str) -> Optional[float]:
   except TypeError:
     return None
 
+def safe_datetime_convert(s: str) -> Optional[datetime]:
+  try:
+    return datetime.fromisoformat(s)
+  except ValueError:
+    return None
+  except TypeError:
+    return None
+
 def value_or(x: Optional[Any], default: Any) -> Any:
   return x if not x is None else default
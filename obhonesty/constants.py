@@ -1,8 +1,13 @@
+import os
 
 default_button_text_size = "4"
 default_heading_size = "8"
 default_text_size = "4"
 
+# Entries per page of the user lists and of a user's order history
+user_page_size = 60
+order_page_size = 50
+
 breakfast_items = [
   "Vegan",
   "Small",
@@ -21,3 +26,73 @@ tax_categories = [
   "Miscellaneous",
   "Accommodation"
 ]
+
+user_headers = [
+  'nick_name', 'first_name', 'last_name', 'phone_number', 'email',
+  'address', 'volunteer', 'away', 'diet', 'allergies', 'owes'
+]
+
+item_headers = ['name', 'price', 'description', 'tax_category']
+
+order_headers = [
+  'order_id', 'user', 'time', 'item', 'quantity', 'price', 'total',
+  'receiver', 'diet', 'allergies', 'served', 'tax_category', 'comment'
+]
+
+# Where data is stored: "sheets", "sqlite", or "mirror" for a local SQLite
+# copy of the sheets that is synced on every snapshot refresh
+storage_backend = os.environ.get("OBHONESTY_STORAGE", "sheets")
+database_path = os.environ.get("OBHONESTY_DATABASE", "obhonesty.db")
+
+# Seconds a shared sheet snapshot is served before it is revalidated
+snapshot_ttl_seconds = float(os.environ.get("OBHONESTY_SNAPSHOT_TTL", "30"))
+
+# A revalidation reads the worksheets only if the spreadsheet's modified time
+# changed, or if they were last read this many seconds ago. 0 reads them on
+# every revalidation.
+sheet_recheck_seconds = float(os.environ.get("OBHONESTY_SHEET_RECHECK", "300"))
+
+# The orders worksheet is read in full this often, to pick up corrections
+# to rows that were already synced
+orders_resync_seconds = float(os.environ.get("OBHONESTY_ORDERS_RESYNC", "300"))
+
+# Open admin sign-up screens are pushed this process's sign-ups as they are
+# made. Every signup_heartbeat_seconds they also check for sign-ups made
+# elsewhere and whether the screen is still connected. A screen stops being
+# watched once it was disconnected for signup_grace_seconds.
+signup_heartbeat_seconds = float(
+  os.environ.get("OBHONESTY_SIGNUP_HEARTBEAT", "30")
+)
+signup_grace_seconds = float(os.environ.get("OBHONESTY_SIGNUP_GRACE", "300"))
+
+# Local journal that orders are written to before being flushed to the sheet
+journal_path = os.environ.get("OBHONESTY_JOURNAL", "orders_journal.db")
+journal_batch_size = int(os.environ.get("OBHONESTY_JOURNAL_BATCH", "50"))
+journal_flush_seconds = float(os.environ.get("OBHONESTY_JOURNAL_FLUSH", "5"))
+
+# Google Sheets API quota per minute, for reads and for writes
+sheets_reads_per_minute = float(
+  os.environ.get("OBHONESTY_SHEETS_READS", "60")
+)
+sheets_writes_per_minute = float(
+  os.environ.get("OBHONESTY_SHEETS_WRITES", "60")
+)
+
+# Fail a reload on malformed cells instead of falling back to defaults
+strict_decoding = os.environ.get("OBHONESTY_STRICT_DECODING", "") == "1"
+
+# Profiling of event handlers: the share of handler runs that are sampled,
+# 0 for none and 1 for all, the seconds between stack samples, whether
+# allocations are traced too, and where the profiles are written. The admin
+# page can profile its own session for profile_trigger_seconds regardless.
+profile_rate = float(os.environ.get("OBHONESTY_PROFILE_RATE", "0"))
+profile_interval = float(os.environ.get("OBHONESTY_PROFILE_INTERVAL", "0.005"))
+profile_memory = os.environ.get("OBHONESTY_PROFILE_MEMORY", "") == "1"
+profile_dir = os.environ.get("OBHONESTY_PROFILE_DIR", "profiles")
+profile_trigger_seconds = 60.0
+
+# Span tracing of events, handlers and Sheets calls, written as JSON lines
+# to a file rotated at trace_max_bytes. Off unless OBHONESTY_TRACE is set.
+trace_path = os.environ.get("OBHONESTY_TRACE", "")
+trace_max_bytes = int(os.environ.get("OBHONESTY_TRACE_MAX_BYTES", "20000000"))
+trace_backups = int(os.environ.get("OBHONESTY_TRACE_BACKUPS", "5"))
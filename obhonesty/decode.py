@@ -0,0 +1,136 @@
+from datetime import datetime
+from operator import itemgetter
+from typing import (
+  Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+)
+
+# Converts one cell; in strict mode, raises ValueError for malformed cells
+Converter = Callable[[Any, bool], Any]
+
+def flag(value: Any, strict: bool) -> bool:
+  if strict and value not in ("yes", "no", ""):
+    raise ValueError(f"'{value}' is not yes or no")
+  return value == "yes"
+
+def number(default: float) -> Converter:
+  def convert(value: Any, strict: bool) -> float:
+    if value == "" or value is None:
+      return default
+    try:
+      return float(value)
+    except ValueError:
+      if strict:
+        raise ValueError(f"'{value}' is not a number")
+      return default
+  return convert
+
+def timestamp(value: Any, strict: bool) -> Any:
+  try:
+    return datetime.fromisoformat(value)
+  except (ValueError, TypeError):
+    if strict and value != "":
+      raise ValueError(f"'{value}' is not a time")
+    return None
+
+
+# (column, model field, converter) for each decoded value; cells without a
+# converter are text and taken as they are
+Field = Tuple[str, str, Optional[Converter]]
+
+user_fields: List[Field] = [
+  ("nick_name", "nick_name", None),
+  ("first_name", "first_name", None),
+  ("last_name", "last_name", None),
+  ("email", "email", None),
+  ("phone_number", "phone_number", None),
+  ("address", "address", None),
+  ("volunteer", "volunteer", flag),
+  ("away", "away", flag),
+  ("diet", "diet", None),
+  ("allergies", "allergies", None),
+  ("owes", "owes", number(0.0))
+]
+
+item_fields: List[Field] = [
+  ("name", "name", None),
+  ("price", "price", number(0.0)),
+  ("description", "description", None),
+  ("tax_category", "tax_category", None)
+]
+
+order_fields: List[Field] = [
+  ("order_id", "order_id", None),
+  ("user", "user_nick_name", None),
+  ("time", "time", None),
+  ("item", "item", None),
+  ("quantity", "quantity", number(1.0)),
+  ("price", "price", number(0.0)),
+  ("total", "total", number(0.0)),
+  ("receiver", "receiver", None),
+  ("diet", "diet", None),
+  ("allergies", "allergies", None),
+  ("served", "served", None),
+  ("tax_category", "tax_category", None),
+  ("comment", "comment", None),
+  ("time", "timestamp", timestamp)
+]
+
+
+class RowDecoder:
+  """Decodes worksheet rows by the positions of their columns in a header.
+
+  The positions are looked up once, after which a row costs one lookup for
+  all its cells and a conversion for each number, flag or time. Models are
+  built with construct(), skipping the validation the converters already
+  did. In strict mode a malformed cell raises a ValueError naming the
+  worksheet row instead of falling back to the default.
+  """
+
+  def __init__(
+    self,
+    title: str,
+    header: Sequence[str],
+    fields: List[Field],
+    strict: bool = False
+  ):
+    missing = sorted({x for x, _, _ in fields if x not in header})
+    if missing:
+      raise ValueError(f"{title} worksheet is missing headers {missing}")
+    self.title = title
+    self.strict = strict
+    self.names = [name for _, name, _ in fields]
+    positions = [list(header).index(x) for x, _, _ in fields]
+    self.cells = itemgetter(*positions)
+    self.conversions = [
+      (i, convert) for i, (_, _, convert) in enumerate(fields)
+      if convert is not None
+    ]
+    self.width = max(positions) + 1
+
+  def values(
+    self, rows: Iterable[Sequence[Any]], first_row: int = 2
+  ) -> Iterator[List[Any]]:
+    """The converted values of each row, in the order of the fields."""
+    strict = self.strict
+    cells = self.cells
+    conversions = self.conversions
+    width = self.width
+    for row_number, row in enumerate(rows, first_row):
+      if len(row) < width:
+        row = list(row) + [""] * (width - len(row))
+      values = list(cells(row))
+      try:
+        for i, convert in conversions:
+          values[i] = convert(values[i], strict)
+      except ValueError as e:
+        raise ValueError(f"{self.title} row {row_number}: {e}") from None
+      yield values
+
+  def decode(
+    self, model: Any, rows: Iterable[Sequence[Any]], first_row: int = 2
+  ) -> List[Any]:
+    names = self.names
+    return [
+      model.construct(**dict(zip(names, x)))
+      for x in self.values(rows, first_row)
+    ]
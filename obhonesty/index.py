@@ -0,0 +1,91 @@
+from array import array
+from bisect import insort
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from obhonesty.order import Order
+from obhonesty.order_store import OrderStore, timestamp_missing
+
+class UserOrderIndex:
+  """Rows of an order store grouped by user in time order, with each user's
+  running total in cents."""
+
+  def __init__(self, store: OrderStore, rows: Iterable[int] = ()):
+    self.store = store
+    self.rows: Dict[int, array] = {}
+    self.totals: Dict[int, int] = {}
+    self.add(rows)
+
+  def add(self, rows: Iterable[int]):
+    users = self.store.text["user"]
+    timestamps = self.store.timestamps
+    for row in rows:
+      user = users[row]
+      user_rows = self.rows.get(user)
+      if user_rows is None:
+        user_rows = self.rows[user] = array("I")
+      if user_rows and timestamps[row] < timestamps[user_rows[-1]]:
+        insort(user_rows, row, key=timestamps.__getitem__)
+      else:
+        user_rows.append(row)
+      self.totals[user] = self.totals.get(user, 0) + self.store.totals[row]
+
+  def user_orders(
+    self, nick_name: str, start: int = 0, stop: Optional[int] = None
+  ) -> List[Order]:
+    """Orders of one user, newest first, from start up to stop."""
+    rows = self.rows.get(self.store.code(nick_name), array("I"))
+    count = len(rows)
+    stop = count if stop is None else min(stop, count)
+    if start >= stop:
+      return []
+    return self.store.views(reversed(rows[count - stop:count - start]))
+
+  def user_order_count(self, nick_name: str) -> int:
+    return len(self.rows.get(self.store.code(nick_name), ()))
+
+  def user_total(self, nick_name: str) -> float:
+    return self.totals.get(self.store.code(nick_name), 0) / 100
+
+
+# Items with their own bucket per day; every other item is a regular item
+signup_items = ("Breakfast sign-up", "Dinner sign-up")
+regular_items = ""
+
+class DayOrderIndex:
+  """Rows of an order store bucketed by day placed and by item type.
+
+  Sign-ups get a bucket per sign-up item, all other orders share the
+  regular items bucket. Orders without a valid timestamp are left out.
+  """
+
+  def __init__(self, store: OrderStore, rows: Iterable[int] = ()):
+    self.store = store
+    self.buckets: Dict[date, Dict[str, array]] = {}
+    self.add(rows)
+
+  def add(self, rows: Iterable[int]):
+    for row in rows:
+      if self.store.timestamps[row] == timestamp_missing:
+        continue
+      day = self.store.timestamp(row).date()
+      buckets = self.buckets.get(day)
+      if buckets is None:
+        buckets = self.buckets[day] = {}
+      item = self.store.string("item", row)
+      kind = item if item in signup_items else regular_items
+      bucket = buckets.get(kind)
+      if bucket is None:
+        bucket = buckets[kind] = array("I")
+      bucket.append(row)
+
+  def orders_on(self, day: date, item: str) -> List[Order]:
+    """Orders of one item placed on the given day."""
+    buckets = self.buckets.get(day, {})
+    if item in signup_items:
+      return self.store.views(buckets.get(item, ()))
+    items = self.store.text["item"]
+    code = self.store.code(item)
+    return self.store.views(
+      x for x in buckets.get(regular_items, ()) if items[x] == code
+    )
@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from obhonesty.constants import (
+  journal_batch_size, journal_flush_seconds, journal_path
+)
+from obhonesty.order import Order
+from obhonesty.repository import order_decoder, repository, snapshot_cache
+from obhonesty.tracing import traced, tracer
+
+# Seconds a claimed batch is reserved for one flusher before others retry it
+lease_seconds = 300.0
+
+class OrderJournal:
+  """Write-behind queue for order rows.
+
+  Rows are committed to a local SQLite journal before the user gets a
+  confirmation. A background thread appends them to the repository in
+  batches and removes them from the journal once they were accepted. Rows
+  left behind by a crash or restart, or by an append that failed but may
+  have been stored even so, are only flushed again once those already
+  stored were dropped.
+  """
+
+  def __init__(self, path: str, batch_size: int, interval: float):
+    self.path = path
+    self.batch_size = batch_size
+    self.interval = interval
+    self.db: Optional[sqlite3.Connection] = None
+    self.connecting = threading.Lock()
+    self.changes = 0
+    # Whether journaled rows may have been stored, see recover
+    self.unsure = True
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.thread: Optional[threading.Thread] = None
+
+  def open(self) -> sqlite3.Connection:
+    """The journal database, created on first use rather than on import."""
+    db = self.db
+    if db is not None:
+      return db
+    with self.connecting:
+      if self.db is None:
+        db = sqlite3.connect(
+          self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        db.execute("pragma journal_mode=wal")
+        db.execute(
+          "create table if not exists orders ("
+          "id integer primary key autoincrement, "
+          "row text not null, "
+          "lease real not null default 0)"
+        )
+        self.db = db
+      return self.db
+
+  @traced("journal")
+  def submit(self, row: List[Any]):
+    db = self.open()
+    with self.lock:
+      db.execute("insert into orders (row) values (?)", (json.dumps(row),))
+      self.changes += 1
+      pending = db.execute("select count(*) from orders").fetchone()[0]
+    if pending >= self.batch_size:
+      self.wakeup.set()
+
+  def pending_orders(self) -> List[Order]:
+    db = self.open()
+    with self.lock:
+      rows = db.execute("select row from orders order by id").fetchall()
+    return order_decoder.decode(Order, [json.loads(row) for (row,) in rows])
+
+  def version(self) -> Tuple[int, int]:
+    """Changes whenever this or another process changed the journal."""
+    db = self.open()
+    with self.lock:
+      data_version = db.execute("pragma data_version").fetchone()[0]
+      return data_version, self.changes
+
+  def claim(self) -> List[Tuple[int, str]]:
+    now = time.time()
+    db = self.open()
+    with self.lock:
+      db.execute("begin immediate")
+      try:
+        rows = db.execute(
+          "select id, row from orders where lease < ? order by id limit ?",
+          (now - lease_seconds, self.batch_size)
+        ).fetchall()
+        db.executemany(
+          "update orders set lease = ? where id = ?",
+          [(now, id) for id, _ in rows]
+        )
+        db.execute("commit")
+      except:
+        db.execute("rollback")
+        raise
+    return rows
+
+  def flush(self) -> int:
+    rows = self.claim()
+    if not rows:
+      return 0
+    ids = [(id,) for id, _ in rows]
+    try:
+      with tracer.span("flush", "journal", rows=len(rows)):
+        repository.append_orders([json.loads(row) for _, row in rows])
+    except:
+      with self.lock:
+        self.db.executemany("update orders set lease = 0 where id = ?", ids)
+      self.unsure = True
+      raise
+    with self.lock:
+      self.db.executemany("delete from orders where id = ?", ids)
+      self.changes += 1
+    return len(rows)
+
+  def recover(self):
+    """Drops the journaled rows whose order ids are stored already."""
+    db = self.open()
+    with self.lock:
+      rows = db.execute("select id, row from orders").fetchall()
+    if rows:
+      order_ids = {id: json.loads(row)[0] for id, row in rows}
+      stored = repository.stored_order_ids(list(order_ids.values()))
+      if stored:
+        print(f"Dropping {len(stored)} journaled orders stored already")
+        with self.lock:
+          db.executemany("delete from orders where id = ?", [
+            (id,) for id, order_id in order_ids.items() if order_id in stored
+          ])
+          self.changes += 1
+        snapshot_cache.get(force=True)
+    self.unsure = False
+
+  def run(self):
+    while True:
+      try:
+        # Nothing is flushed until it is known what was stored
+        if self.unsure:
+          self.recover()
+        flushed = 0
+        while count := self.flush():
+          flushed += count
+        if flushed:
+          snapshot_cache.get(force=True)
+      except Exception as e:
+        print(f"Failed to flush journaled orders: {e}")
+      self.wakeup.wait(self.interval)
+      self.wakeup.clear()
+
+  def start(self):
+    if self.thread is None:
+      self.thread = threading.Thread(target=self.run, daemon=True)
+      self.thread.start()
+
+
+order_journal = OrderJournal(
+  journal_path, journal_batch_size, journal_flush_seconds
+)
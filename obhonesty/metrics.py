@@ -0,0 +1,106 @@
+import functools
+import inspect
+import time
+from typing import Any, Callable
+
+from fastapi import Response
+from prometheus_client import (
+  CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+)
+
+# Event handlers run from well under a millisecond to a slow sheet reload
+handler_buckets = (
+  0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+fast_buckets = (
+  0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+  0.25, 1.0
+)
+
+handler_seconds = Histogram(
+  "obhonesty_handler_seconds",
+  "Run time of event handlers",
+  ["handler"],
+  buckets=handler_buckets
+)
+sheets_calls = Counter(
+  "obhonesty_sheets_calls_total",
+  "Calls to the Google Sheets API, retries included",
+  ["worksheet", "operation"]
+)
+sheets_seconds = Histogram(
+  "obhonesty_sheets_seconds",
+  "Latency of calls to the Google Sheets API",
+  ["worksheet", "operation"],
+  buckets=handler_buckets
+)
+sheets_errors = Counter(
+  "obhonesty_sheets_errors_total",
+  "Failed calls to the Google Sheets API, by HTTP status or exception",
+  ["worksheet", "operation", "code"]
+)
+sheets_outcomes = Counter(
+  "obhonesty_sheets_outcomes_total",
+  "Throttled, retried, failed and rejected calls, as in Sheets.counters",
+  ["outcome"]
+)
+sheets_circuit_open = Gauge(
+  "obhonesty_sheets_circuit_open",
+  "1 while the circuit breaker keeps calls from Google Sheets"
+)
+snapshot_refresh_seconds = Histogram(
+  "obhonesty_snapshot_refresh_seconds",
+  "Time taken to load a new snapshot",
+  buckets=handler_buckets
+)
+snapshot_refresh_failures = Counter(
+  "obhonesty_snapshot_refresh_failures_total",
+  "Snapshot refreshes that failed"
+)
+snapshot_age = Gauge(
+  "obhonesty_snapshot_age_seconds",
+  "Seconds since the current snapshot was loaded"
+)
+snapshot_rows = Gauge(
+  "obhonesty_snapshot_rows",
+  "Rows in the current snapshot, by worksheet",
+  ["worksheet"]
+)
+computed_var_seconds = Histogram(
+  "obhonesty_computed_var_seconds",
+  "Time taken to compute the vars sent to sessions",
+  ["var"],
+  buckets=fast_buckets
+)
+sessions = Gauge(
+  "obhonesty_sessions",
+  "Sessions connected to the backend"
+)
+
+def timed_handler(fn: Callable[..., Any]) -> Callable[..., Any]:
+  """Records the run time of an event handler in handler_seconds.
+
+  Apply it below rx.event, which needs to see an async handler as async.
+  """
+  histogram = handler_seconds.labels(fn.__name__)
+  if inspect.iscoroutinefunction(fn):
+    @functools.wraps(fn)
+    async def timed(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return await fn(*args, **kwargs)
+      finally:
+        histogram.observe(time.perf_counter() - start)
+  else:
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        histogram.observe(time.perf_counter() - start)
+  return timed
+
+def endpoint() -> Response:
+  """The /metrics endpoint, in the Prometheus text format."""
+  return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
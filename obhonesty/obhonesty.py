@@ -2,10 +2,28 @@
 
 import reflex as rx
 
+from obhonesty import metrics
+from obhonesty.journal import order_journal
 from obhonesty.pages import * 
+from obhonesty.repository import snapshot_cache
+from obhonesty.roster import signup_feed
+from obhonesty.sheet import sheets
 from obhonesty.state import State
+from obhonesty.tracing import tracer
 
 app = rx.App()
+# Only the backend server runs these, not every import of the app
+app.register_lifespan_task(sheets.warm_up)
+app.register_lifespan_task(snapshot_cache.prefetch)
+app.register_lifespan_task(order_journal.start)
+app.api.get("/metrics")(metrics.endpoint)
+tracer.install(app)
+metrics.sessions.set_function(
+  lambda: len(app.event_namespace.sid_to_token) if app.event_namespace else 0
+)
+signup_feed.is_connected = lambda token: (
+  app.event_namespace is None or token in app.event_namespace.token_to_sid
+)
 app.add_page(index, route="/", on_load=State.reload_sheet_data)
 app.add_page(user_page, route="/user", on_load=State.redirect_no_user)
 app.add_page(user_signup_page, route="/signup")
@@ -16,6 +34,9 @@ app.add_page(user_info_page, route="/info", on_load=State.reload_sheet_data)
 app.add_page(admin, route="/admin")
 app.add_page(admin_dinner, route="/admin/dinner", on_load=State.reload_sheet_data)
 app.add_page(admin_breakfast, route="/admin/breakfast", on_load=State.reload_sheet_data)
-app.add_page(admin_tax, route="/admin/tax", on_load=State.reload_sheet_data)
+app.add_page(
+  admin_tax, route="/admin/tax",
+  on_load=[State.reload_sheet_data, State.run_tax_report]
+)
 app.add_page(admin_user_page, route="/admin/user", on_load=State.reload_sheet_data)
 app.add_page(late_dinner_signup_page, route="/admin/late", on_load=State.reload_sheet_data)
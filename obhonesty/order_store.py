@@ -0,0 +1,126 @@
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from obhonesty.aux import safe_datetime_convert
+from obhonesty.order import Order
+
+# Stored for orders without a valid time; reads as NaT in NumPy
+timestamp_missing = -2 ** 63
+
+epoch = datetime(1970, 1, 1)
+microsecond = timedelta(microseconds=1)
+
+class OrderStore:
+  """Orders stored column by column.
+
+  Text columns are interned: each row holds an integer code into one table
+  of distinct strings. Quantities are floats, prices and totals integer
+  cents, all in typed arrays. Times are kept as microseconds since the
+  epoch, and the original text only where it differs from the parsed time.
+  Order models are built by view(), for the rows that are shown.
+
+  Rows are only ever appended, so readers can use any row below len().
+  """
+
+  text_columns = (
+    "user", "item", "tax_category", "receiver", "diet", "allergies",
+    "served", "comment"
+  )
+
+  def __init__(self, values: Iterable[Sequence[Any]] = ()):
+    self.strings: List[str] = []
+    self.codes: Dict[str, int] = {}
+    self.text = {x: array("I") for x in self.text_columns}
+    self.quantities = array("d")
+    self.prices = array("q")
+    self.totals = array("q")
+    self.timestamps = array("q")
+    self.times: Dict[int, str] = {}
+    self.order_ids: List[str] = []
+    self.extend(values)
+
+  def __len__(self) -> int:
+    return len(self.order_ids)
+
+  def intern(self, value: str) -> int:
+    code = self.codes.get(value)
+    if code is None:
+      code = self.codes[value] = len(self.strings)
+      self.strings.append(value)
+    return code
+
+  def code(self, value: str) -> Optional[int]:
+    """The code of a string, or None if no row holds it."""
+    return self.codes.get(value)
+
+  def string(self, column: str, row: int) -> str:
+    return self.strings[self.text[column][row]]
+
+  def extend(self, values: Iterable[Sequence[Any]]):
+    """Appends orders decoded with decode.order_fields."""
+    text = [self.text[x] for x in self.text_columns]
+    for (order_id, user, time, item, quantity, price, total, receiver, diet,
+        allergies, served, tax_category, comment, timestamp) in values:
+      row = len(self.order_ids)
+      for column, value in zip(text, (user, item, tax_category, receiver,
+          diet, allergies, served, comment)):
+        column.append(self.intern(value))
+      self.quantities.append(quantity)
+      self.prices.append(round(price * 100))
+      self.totals.append(round(total * 100))
+      if timestamp is None or timestamp.tzinfo is not None:
+        self.timestamps.append(timestamp_missing)
+      else:
+        self.timestamps.append((timestamp - epoch) // microsecond)
+      if timestamp is None or str(timestamp) != time:
+        self.times[row] = time
+      # Appended last, so the row only counts once all columns hold it
+      self.order_ids.append(order_id)
+
+  def timestamp(self, row: int) -> Optional[datetime]:
+    micros = self.timestamps[row]
+    if micros == timestamp_missing:
+      return safe_datetime_convert(self.times[row])
+    return epoch + micros * microsecond
+
+  def row(self, row: int) -> List[Any]:
+    """The row as written to the orders worksheet."""
+    timestamp = self.timestamp(row)
+    return [
+      self.order_ids[row],
+      self.string("user", row),
+      self.times.get(row, str(timestamp)),
+      self.string("item", row),
+      self.quantities[row],
+      self.prices[row] / 100,
+      self.totals[row] / 100,
+      self.string("receiver", row),
+      self.string("diet", row),
+      self.string("allergies", row),
+      self.string("served", row),
+      self.string("tax_category", row),
+      self.string("comment", row)
+    ]
+
+  def view(self, row: int) -> Order:
+    timestamp = self.timestamp(row)
+    return Order.construct(
+      order_id=self.order_ids[row],
+      user_nick_name=self.string("user", row),
+      time=self.times.get(row, str(timestamp)),
+      item=self.string("item", row),
+      quantity=self.quantities[row],
+      price=self.prices[row] / 100,
+      total=self.totals[row] / 100,
+      receiver=self.string("receiver", row),
+      diet=self.string("diet", row),
+      allergies=self.string("allergies", row),
+      served=self.string("served", row),
+      tax_category=self.string("tax_category", row),
+      comment=self.string("comment", row),
+      timestamp=timestamp
+    )
+
+  def views(self, rows: Iterable[int]) -> List[Order]:
+    return [self.view(x) for x in rows]
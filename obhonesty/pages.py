@@ -1,21 +1,43 @@
-from typing import Callable
+from typing import Callable, List
 
 import reflex as rx
+from reflex.components.core.banner import has_connection_errors
+from reflex.vars import VarData
 
 from obhonesty.aux import two_decimal_points
 from obhonesty.constants import *
 from obhonesty.item import Item
 from obhonesty.order import Order
+from obhonesty.report import ReportRow
 from obhonesty.state import State
-from obhonesty.user import User
+from obhonesty.user import UserCard
 
 
+def pager(
+  page: rx.Var, page_count: rx.Var, show: rx.EventHandler
+) -> rx.Component:
+  """Buttons to the previous and next page, around the page number."""
+  return rx.hstack(
+    rx.button(
+      rx.icon("chevron-left"),
+      on_click=show(page - 1),
+      disabled=page == 0
+    ),
+    rx.text(f"Page {page + 1} of {page_count}", size=default_text_size),
+    rx.button(
+      rx.icon("chevron-right"),
+      on_click=show(page + 1),
+      disabled=page + 1 >= page_count
+    ),
+    align="center"
+  )
+
 def index() -> rx.Component:
   # Welcome Page (Index)
-  user_button: Callable[[User], rx.Component] = lambda user: \
+  user_button: Callable[[UserCard], rx.Component] = lambda user: \
     rx.button(
       rx.text(user.nick_name, size=default_button_text_size),
-      on_click=State.redirect_to_user_page(user),
+      on_click=State.redirect_to_user_page(user.nick_name),
       size="4"
     )
   return rx.container(
@@ -35,9 +57,20 @@ def index() -> rx.Component:
           )
         ),
         rx.text(f"Find yourself and place an order", size=default_text_size),
+        rx.debounce_input(
+          rx.input(
+            rx.input.slot(rx.icon("search")),
+            placeholder="Search by nick or name",
+            value=State.search_query,
+            on_change=State.search_users,
+            size="3"
+          ),
+          debounce_timeout=300
+        ),
+        rx.cond(State.loading, rx.spinner(size="3")),
         rx.scroll_area(
           rx.flex(
-            rx.foreach(State.users, user_button),
+            rx.foreach(State.user_cards, user_button),
             padding="8px",
             spacing="4",
             style={"width": "max"},
@@ -45,8 +78,9 @@ def index() -> rx.Component:
           ),
           type="always",
           scrollbars="vertical",
-          style={"height": "80vh"}
-        )
+          style={"height": "75vh"}
+        ),
+        pager(State.user_page, State.user_page_count, State.show_user_page)
       )
     )
   )
@@ -114,7 +148,7 @@ def user_page() -> rx.Component:
       ),
       rx.text(
         f"Breakfast sign-up closed "
-        f"(last sign-up at {State.admin_data['breakfast_signup_deadline']})",
+        f"(last sign-up at {State.settings['breakfast_signup_deadline']})",
         size=default_text_size
       )
     ), 
@@ -127,7 +161,7 @@ def user_page() -> rx.Component:
       ),
       rx.text(
         f"Dinner sign-up closed "
-        f"(last sign-up at {State.admin_data['dinner_signup_deadline']}, "
+        f"(last sign-up at {State.settings['dinner_signup_deadline']}, "
         f"for late sign-ups, please ask the kitchen staff)",
         size=default_text_size
       )
@@ -140,7 +174,7 @@ def user_page() -> rx.Component:
     ),
     rx.scroll_area(
       rx.flex(
-        rx.foreach(State.items.values(), item_button),
+        rx.foreach(State.menu, item_button),
         padding="8px",
         spacing="4",
         style={"width": "max"},
@@ -287,7 +321,7 @@ def dinner_signup_page() -> rx.Component:
           rx.text(
             f"Note: you are signing up for todays dinner. "
             f"Sign up again tomorrow for tomorrows dinner. "
-            f"Price per person is {State.admin_data['dinner_price']}€. "
+            f"Price per person is {State.settings['dinner_price']}€. "
             f"If you are signing up yourself, just write your own full name. "
             f"You can also sign up someone else on your tab, "
             f"in that case write the full name of the guest you are signing up."
@@ -336,7 +370,7 @@ def late_dinner_signup_page() -> rx.Component:
           rx.text("Full name of dinner guest", weight="bold"),
           rx.input(placeholder="Full name", name="full_name", required=True),
           rx.text("User paying for this dinner sign-up", weight="bold"),
-          rx.select(State.get_all_nick_names, required=True, name="nick_name"),
+          rx.select(State.nick_names, required=True, name="nick_name"),
           rx.text("Dietary preferences", weight="bold"),
           rx.select(
             ["Vegan", "Vegetarian", "Meat"],
@@ -393,7 +427,7 @@ def breakfast_signup_page() -> rx.Component:
               rx.foreach(
                 breakfast_items,
                 lambda item: rx.select.item(
-                  f"{item} ({State.admin_data[item + "_price"]}€)",
+                  f"{item} ({State.settings[item + "_price"]}€)",
                   value=item
                 )
               )
@@ -463,18 +497,19 @@ def user_info_page() -> rx.Component:
     	  )
     	),
       scrollbars="vertical",
-      style={"height": "70vh"}
-		)
+      style={"height": "65vh"}
+		),
+    pager(State.order_page, State.order_page_count, State.show_order_page)
   )))
 
 def admin() -> rx.Component:
-  def user_button(user: User):
+  def user_button(user: UserCard):
     return rx.button(
       rx.text(
         f"{user.full_name} ({user.nick_name})",
         size=default_button_text_size
       ),
-      on_click=State.redirect_to_admin_user_page(user)
+      on_click=State.redirect_to_admin_user_page(user.nick_name)
     )
   return rx.container(rx.center(
     rx.vstack(
@@ -482,9 +517,16 @@ def admin() -> rx.Component:
       rx.button(
         rx.icon("refresh-cw"),
         rx.text("Reload", size=default_button_text_size),
-        on_click=State.reload_sheet_data,
+        on_click=State.reload_sheet_data(True),
+        loading=State.loading,
         color_scheme="green"
       ),
+      rx.button(
+        rx.icon("activity"),
+        rx.text("Profile", size=default_button_text_size),
+        on_click=State.profile_session,
+        color_scheme="gray"
+      ),
       rx.button(
         rx.text("Dinner", size=default_button_text_size),
         on_click=rx.redirect("/admin/dinner")
@@ -497,21 +539,80 @@ def admin() -> rx.Component:
         rx.text("Tax", size=default_button_text_size),
         on_click=rx.redirect("/admin/tax")
       ),
+      rx.form(
+        rx.hstack(
+          rx.text("Close orders placed before"),
+          rx.input(name="until", type="date", required=True),
+          rx.button(
+            rx.text("Close period", size=default_button_text_size),
+            type="submit",
+            loading=State.closing,
+            color_scheme="orange"
+          )
+        ),
+        on_submit=State.close_period
+      ),
       rx.text("Users:"),
-      rx.foreach(State.users, user_button)
+      rx.foreach(State.user_cards, user_button),
+      pager(State.user_page, State.user_page_count, State.show_user_page)
     ) 
   ))
 
 def admin_tax() -> rx.Component:
+  def show_row(row: ReportRow):
+    return rx.table.row(
+      rx.table.cell(row.period),
+      rx.table.cell(row.tax_category),
+      rx.table.cell(row.item),
+      rx.table.cell(f"{row.quantity}"),
+      rx.table.cell(f"{row.total}€")
+    )
+
   return rx.container(rx.center(rx.vstack(
     rx.heading("Tax categories", size=default_heading_size),
     rx.button(
       rx.text("Go back", size=default_button_text_size),
       on_click=rx.redirect("/admin")
     ),
+    rx.form(
+      rx.hstack(
+        rx.text("From"),
+        rx.input(name="start", type="date", default_value=State.report_start),
+        rx.text("to"),
+        rx.input(name="end", type="date", default_value=State.report_end),
+        rx.select(
+          ["month", "day"], default_value=State.report_period, name="period"
+        ),
+        rx.button(rx.text("Show", size=default_button_text_size), type="submit")
+      ),
+      on_submit=State.run_tax_report
+    ),
     rx.foreach(
       State.tax_categories.items(),
       lambda x: rx.text(f"{x[0]}: {x[1]}")
+    ),
+    rx.button(
+      rx.icon("download"),
+      rx.text("Download CSV", size=default_button_text_size),
+      on_click=State.download_tax_report
+    ),
+    rx.scroll_area(
+      rx.table.root(
+        rx.table.header(
+          rx.table.row(
+            rx.table.column_header_cell("Period"),
+            rx.table.column_header_cell("Category"),
+            rx.table.column_header_cell("Item"),
+            rx.table.column_header_cell("Quantity"),
+            rx.table.column_header_cell("Total")
+          )
+        ),
+        rx.table.body(rx.foreach(State.tax_report, show_row)),
+        variant="surface"
+      ),
+      type="always",
+      scrollbars="vertical",
+      style={"height": "60vh"}
     )
   )))
 
@@ -523,12 +624,35 @@ def admin_refresh_top_bar() -> rx.Component:
     ),
     rx.button(
       rx.icon("refresh-cw"), rx.text("Reload", size=default_button_text_size),
-      on_click=State.reload_sheet_data,
+      on_click=State.reload_sheet_data(True),
+      loading=State.loading,
       color_scheme="green"
     ),
     spacing="2"
   )
 
+class SignupWatch(rx.Fragment):
+  """Starts the sign-up watch when the page mounts, and again each time the
+  connection is back after errors, since a reconnect does not load the page.
+  """
+
+  def add_hooks(self) -> List[rx.Var]:
+    start = rx.Var.create(State.watch_signups())
+    return [rx.Var(
+      _js_expr=(
+        f"useEffect(() => {{ if (!{has_connection_errors}) "
+        f"addEvents([{start}]) }}, [{has_connection_errors}])"
+      ),
+      _var_data=VarData.merge(
+        VarData(imports={"react": ["useEffect"]}),
+        start._get_all_var_data(),
+        has_connection_errors._get_all_var_data()
+      )
+    )]
+
+def signup_watch() -> rx.Component:
+  return SignupWatch.create()
+
 def admin_dinner() -> rx.Component:
   def show_signup(signup: Order):
     return rx.table.row( 
@@ -542,6 +666,7 @@ def admin_dinner() -> rx.Component:
     rx.vstack(
       rx.heading("Dinner", size=default_heading_size), 
       admin_refresh_top_bar(),
+      signup_watch(),
       rx.button(
         rx.text("Late sign-up", size=default_button_text_size),
         on_click=rx.redirect("/admin/late")
@@ -581,6 +706,7 @@ def admin_breakfast() -> rx.Component:
     rx.vstack(
       rx.heading("Breakfast", size=default_heading_size),
       admin_refresh_top_bar(), 
+      signup_watch(),
       rx.scroll_area(
         rx.table.root(
           rx.table.header(
@@ -616,5 +742,5 @@ def admin_user_page() -> rx.Component:
     rx.text(f"Email: {State.current_user.email}"),
     rx.text(f"Phone: {State.current_user.phone_number}"),
     rx.text(f"Address: {State.current_user.address}"),
-    rx.text(f"Owes: {State.get_user_debt}€")
+    rx.text(f"Owes: {State.user_debt}€")
   )))
\ No newline at end of file
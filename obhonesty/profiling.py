@@ -0,0 +1,203 @@
+import asyncio
+from collections import Counter
+import functools
+import inspect
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from obhonesty.constants import (
+  profile_dir, profile_interval, profile_memory, profile_rate
+)
+
+# Leaf frames of threads that are idle rather than working
+idle_frames = {("selectors.py", "select"), ("thread.py", "_worker")}
+
+def collapse(frame: FrameType, thread: str) -> Optional[str]:
+  """The stack as a line of a collapsed stack file, or None when idle."""
+  code = frame.f_code
+  if (os.path.basename(code.co_filename), code.co_name) in idle_frames:
+    return None
+  names: List[str] = []
+  while frame is not None:
+    code = frame.f_code
+    names.append(
+      f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+      f"{code.co_firstlineno})"
+    )
+    frame = frame.f_back
+  names.append(thread)
+  return ";".join(reversed(names))
+
+
+class StackSampler:
+  """Samples the stacks of all threads while any recording is open.
+
+  Handlers hand work to other threads, so every thread is sampled, not only
+  the one the handler started on. Recordings that overlap share samples.
+  """
+
+  def __init__(self, interval: float):
+    self.interval = interval
+    self.recordings: List[Counter] = []
+    self.thread: Optional[threading.Thread] = None
+    self.lock = threading.Lock()
+
+  def start(self) -> Counter:
+    stacks: Counter = Counter()
+    with self.lock:
+      self.recordings.append(stacks)
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    return stacks
+
+  def stop(self, stacks: Counter):
+    with self.lock:
+      self.recordings.remove(stacks)
+
+  def run(self):
+    me = threading.get_ident()
+    while True:
+      names = {x.ident: x.name for x in threading.enumerate()}
+      sample = Counter(
+        x for x in (
+          collapse(frame, names.get(ident, str(ident)))
+          for ident, frame in sys._current_frames().items() if ident != me
+        )
+        if x is not None
+      )
+      with self.lock:
+        if not self.recordings:
+          self.thread = None
+          return
+        for stacks in self.recordings:
+          stacks.update(sample)
+      time.sleep(self.interval)
+
+
+class Profiler:
+  """Profiles a share of handler runs, and all runs of armed sessions.
+
+  Each profiled run writes the stacks sampled while it ran, in the collapsed
+  format that flame graph tools read, and with memory tracing the top
+  allocations made meanwhile, to files named after the handler.
+  """
+
+  top_allocations = 25
+
+  def __init__(
+    self, directory: str, rate: float, interval: float, memory: bool
+  ):
+    self.directory = directory
+    self.rate = rate
+    self.memory = memory
+    self.sampler = StackSampler(interval)
+    # Client tokens of armed sessions, to when they are armed
+    self.armed: Dict[str, float] = {}
+    self.tracing = 0
+    self.numbers = itertools.count()
+    self.lock = threading.Lock()
+
+  def arm(self, token: str, seconds: float):
+    """Profiles all handler runs of the session for the given time."""
+    with self.lock:
+      self.armed[token] = time.monotonic() + seconds
+
+  def is_armed(self, token: str) -> bool:
+    with self.lock:
+      until = self.armed.get(token)
+      if until is not None and until < time.monotonic():
+        del self.armed[token]
+        until = None
+    return until is not None
+
+  def start(self, token: str) -> Optional[Tuple[Counter, Any]]:
+    """Starts a recording if this run is to be profiled."""
+    armed = self.is_armed(token)
+    if not armed and (self.rate <= 0 or random.random() >= self.rate):
+      return None
+    snapshot = None
+    if armed or self.memory:
+      with self.lock:
+        self.tracing += 1
+        if not tracemalloc.is_tracing():
+          tracemalloc.start()
+        snapshot = tracemalloc.take_snapshot()
+    return self.sampler.start(), snapshot
+
+  def stop(self, name: str, recording: Tuple[Counter, Any], seconds: float):
+    stacks, before = recording
+    self.sampler.stop(stacks)
+    allocations = None
+    if before is not None:
+      with self.lock:
+        allocations = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        self.tracing -= 1
+        if self.tracing == 0:
+          tracemalloc.stop()
+    try:
+      self.write(name, stacks, allocations, seconds)
+    except OSError as e:
+      print(f"Failed to write the profile of {name}: {e}")
+
+  def write(
+    self, name: str, stacks: Counter, allocations: Optional[List[Any]],
+    seconds: float
+  ):
+    os.makedirs(self.directory, exist_ok=True)
+    path = os.path.join(
+      self.directory,
+      f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self.numbers)}-{name}"
+    )
+    with open(f"{path}.collapsed", "w") as f:
+      for stack, count in stacks.most_common():
+        f.write(f"{stack} {count}\n")
+    if allocations is not None:
+      with open(f"{path}.allocations.txt", "w") as f:
+        f.write(f"{name} ran {seconds:.3f} seconds\n")
+        for statistic in allocations[:self.top_allocations]:
+          f.write(f"{statistic}\n")
+
+  def profiled(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Profiles runs of an event handler, see start.
+
+    Apply it below rx.event, and above metrics.timed_handler so that the
+    handler's run time leaves out the profiling.
+    """
+    name = fn.__name__
+    if inspect.iscoroutinefunction(fn):
+      @functools.wraps(fn)
+      async def run(state, *args, **kwargs):
+        recording = self.start(state.router.session.client_token)
+        if recording is None:
+          return await fn(state, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+          return await fn(state, *args, **kwargs)
+        finally:
+          await asyncio.to_thread(
+            self.stop, name, recording, time.perf_counter() - start
+          )
+    else:
+      @functools.wraps(fn)
+      def run(state, *args, **kwargs):
+        recording = self.start(state.router.session.client_token)
+        if recording is None:
+          return fn(state, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+          return fn(state, *args, **kwargs)
+        finally:
+          self.stop(name, recording, time.perf_counter() - start)
+    return run
+
+
+profiler = Profiler(profile_dir, profile_rate, profile_interval, profile_memory)
+profiled = profiler.profiled
@@ -0,0 +1,151 @@
+import csv
+from datetime import date
+import io
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import reflex as rx
+
+from obhonesty.order_store import OrderStore
+from obhonesty.repository import repository, snapshot_cache
+
+periods = {"day": "datetime64[D]", "month": "datetime64[M]"}
+
+class ReportRow(rx.Base):
+  period: str
+  tax_category: str
+  item: str
+  quantity: float
+  total: float
+
+
+class OrderColumns:
+  """A NumPy copy of the columns of one or more order stores for reporting.
+
+  Tax categories and items are stored as codes into their arrays of unique
+  values; orders without a valid timestamp have no day (NaT).
+  """
+
+  def __init__(self, *stores: OrderStore):
+    # Slices copy the arrays, so the stores can keep growing meanwhile
+    sized = [(x, len(x)) for x in stores]
+    self.days = np.concatenate([
+      np.array(store.timestamps[:size], dtype=np.int64)
+      for store, size in sized
+    ]).astype("datetime64[us]").astype("datetime64[D]")
+    self.categories, self.category_codes = self.factorize(
+      sized, "tax_category"
+    )
+    self.items, self.item_codes = self.factorize(sized, "item")
+    self.quantities = np.concatenate([
+      np.array(store.quantities[:size], dtype=np.float64)
+      for store, size in sized
+    ])
+    self.totals = np.concatenate([
+      np.array(store.totals[:size], dtype=np.int64) for store, size in sized
+    ]) / 100
+
+  @staticmethod
+  def factorize(
+    sized: List[Tuple[OrderStore, int]], column: str
+  ) -> Tuple[np.ndarray, np.ndarray]:
+    """The distinct values of a column in sorted order, and row codes."""
+    parts = []
+    for store, size in sized:
+      codes, inverse = np.unique(
+        np.array(store.text[column][:size], dtype=np.int64),
+        return_inverse=True
+      )
+      parts.append(
+        (np.array([store.strings[x] for x in codes], dtype=object), inverse)
+      )
+    values = np.unique(np.concatenate([x for x, _ in parts]))
+    return values, np.concatenate([
+      np.searchsorted(values, x)[inverse].astype(np.int64)
+      for x, inverse in parts
+    ])
+
+  def report(
+    self, start: date, end: date, period: str
+  ) -> Tuple[List[ReportRow], Dict[str, float]]:
+    """Quantity and revenue per period, tax category and item.
+
+    Also returns the revenue per tax category over the whole range.
+    """
+    mask = (self.days >= np.datetime64(start, "D")) & \
+      (self.days <= np.datetime64(end, "D"))
+    if not mask.any():
+      return [], {}
+    buckets, bucket_codes = np.unique(
+      self.days[mask].astype(periods[period]), return_inverse=True
+    )
+    category_codes = self.category_codes[mask]
+    shape = (len(buckets), len(self.categories), len(self.items))
+    keys, groups = np.unique(
+      np.ravel_multi_index(
+        (bucket_codes, category_codes, self.item_codes[mask]), shape
+      ),
+      return_inverse=True
+    )
+    quantities = np.bincount(groups, self.quantities[mask])
+    totals = np.bincount(groups, self.totals[mask])
+    rows = [
+      ReportRow(
+        period=str(buckets[b]),
+        tax_category=self.categories[c],
+        item=self.items[i],
+        quantity=float(quantities[g]),
+        total=round(float(totals[g]), 2)
+      )
+      for g, (b, c, i) in enumerate(zip(*np.unravel_index(keys, shape)))
+    ]
+    categories, category_groups = np.unique(
+      category_codes, return_inverse=True
+    )
+    category_totals = np.bincount(category_groups, self.totals[mask])
+    return rows, {
+      self.categories[c]: round(float(total), 2)
+      for c, total in zip(categories, category_totals)
+    }
+
+
+class OrderColumnsCache:
+  """The columnar copy of the archived and the current snapshot's orders.
+
+  It is only built again when the snapshot's order markers moved, and the
+  archive is only read again when its own marker did.
+  """
+
+  def __init__(self):
+    self.orders: Any = None
+    self.archived: Any = None
+    self.archive = OrderStore()
+    self.columns: Optional[OrderColumns] = None
+    self.lock = threading.Lock()
+
+  def get(self) -> OrderColumns:
+    snapshot = snapshot_cache.get()
+    # Read before the orders, so a write in between only rebuilds again
+    orders, archived = snapshot.order_versions()
+    with self.lock:
+      if self.columns is None or orders != self.orders:
+        if self.columns is None or archived != self.archived:
+          self.archive = repository.load_archive()
+        self.columns = OrderColumns(self.archive, snapshot.order_store())
+        self.orders = orders
+        self.archived = archived
+      return self.columns
+
+
+order_columns = OrderColumnsCache()
+
+def report_csv(rows: List[ReportRow]) -> str:
+  output = io.StringIO()
+  writer = csv.writer(output)
+  writer.writerow(["period", "tax_category", "item", "quantity", "total"])
+  for row in rows:
+    writer.writerow(
+      [row.period, row.tax_category, row.item, row.quantity, row.total]
+    )
+  return output.getvalue()
@@ -0,0 +1,797 @@
+from datetime import date
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import numericise_all, rowcol_to_a1
+from requests.exceptions import RequestException
+
+from obhonesty import metrics
+from obhonesty.aux import (
+  safe_datetime_convert, safe_float_convert, value_or
+)
+from obhonesty.constants import (
+  database_path, item_headers, order_headers, orders_resync_seconds,
+  sheet_recheck_seconds, snapshot_ttl_seconds, storage_backend,
+  strict_decoding, user_headers
+)
+from obhonesty.decode import RowDecoder, item_fields, order_fields, user_fields
+from obhonesty.index import DayOrderIndex, UserOrderIndex
+from obhonesty.item import Item
+from obhonesty.order import Order
+from obhonesty.order_store import OrderStore
+from obhonesty.sheet import SheetsUnavailable, row_data, sheets
+from obhonesty.snapshot import Snapshot, SnapshotCache
+from obhonesty.user import User
+
+class Repository:
+  """Where users, items, orders and admin settings are stored."""
+
+  def load_snapshot(self) -> Snapshot:
+    raise NotImplementedError
+
+  def append_orders(self, rows: List[List[Any]]):
+    raise NotImplementedError
+
+  def append_user(self, row: List[Any]):
+    raise NotImplementedError
+
+  def stored_order_ids(self, order_ids: List[str]) -> Set[str]:
+    """Those of the given orders that are stored."""
+    raise NotImplementedError
+
+  def load_archive(self) -> OrderStore:
+    """The orders closed by close_period."""
+    raise NotImplementedError
+
+  def close_period(self, until: date) -> int:
+    """Closes the orders placed before the given day.
+
+    Their totals are added to each user's opening balance (owes), and the
+    orders are moved to the archive. Returns how many orders were closed.
+    """
+    raise NotImplementedError
+
+
+def unknown_users(totals: Dict[str, float], users: List[str]) -> List[str]:
+  known = set(users)
+  return sorted(x for x in totals if x not in known)
+
+
+def to_records(
+  title: str, header: List[str], rows: List[List[str]], expected: List[str]
+) -> List[Dict[str, str]]:
+  """Decodes rows by the positions of the expected columns in the header."""
+  missing = [x for x in expected if x not in header]
+  if missing:
+    raise ValueError(f"{title} worksheet is missing headers {missing}")
+  positions = [(x, header.index(x)) for x in expected]
+  return [
+    {x: row[i] if i < len(row) else "" for x, i in positions} for row in rows
+  ]
+
+
+class OrderSync:
+  """Follows the append-only orders worksheet.
+
+  After the first full read, only the rows below the last ingested one are
+  fetched, together with the header and the last ingested row itself. If
+  either of those no longer matches, rows were edited or removed and the
+  whole worksheet is read again.
+
+  Edits above the last row do not show in those ranges, so every
+  orders_resync_seconds the whole worksheet is read and hashed. Only if
+  its rows differ from the ingested ones is the store rebuilt.
+  """
+
+  def __init__(self):
+    self.header: List[str] = []
+    self.last_row: List[str] = []
+    self.row_count = 0
+    # Hash of the ingested rows, and when the whole worksheet was last read
+    self.digest = hashlib.sha1()
+    self.read_at = float("-inf")
+    self.decoder: Optional[RowDecoder] = None
+    self.store = OrderStore()
+    self.user_index = UserOrderIndex(self.store)
+    self.day_index = DayOrderIndex(self.store)
+
+  def ranges(self) -> List[str]:
+    """The ranges to fetch for the next sync."""
+    if self.row_count == 0 or \
+        time.monotonic() - self.read_at >= orders_resync_seconds:
+      return ["orders"]
+    last_column = rowcol_to_a1(1, len(self.header)).rstrip("0123456789")
+    return ["orders!1:1", f"orders!A{self.row_count + 1}:{last_column}"]
+
+  def apply(self, values: List[List[List[str]]]) -> Optional[range]:
+    """Ingests the fetched ranges and returns the store rows they added.
+
+    Returns None when the ranges show that the worksheet changed, after
+    which the next ranges cover the whole worksheet.
+    """
+    if len(values) == 1:
+      return self.resync(values[0])
+    header, tail = values
+    header = self.trim(header[0]) if header else []
+    if header != self.header or not tail or \
+        self.pad(tail[0]) != self.last_row:
+      self.row_count = 0
+      return None
+    return self.ingest(tail[1:])
+
+  def resync(self, values: List[List[str]]) -> range:
+    """Ingests the rows below the ingested ones of the whole worksheet, or
+    all rows if any ingested one changed."""
+    self.read_at = time.monotonic()
+    header = self.trim(values[0]) if values else []
+    rows = values[1:]
+    if self.row_count == 0 or header != self.header or \
+        len(rows) < self.row_count or \
+        self.hash(rows[:self.row_count]).digest() != self.digest.digest():
+      if self.row_count > 0:
+        print("Synced orders were edited, reloading all orders")
+      return self.reset(values)
+    return self.ingest(rows[self.row_count:])
+
+  def reset(self, values: List[List[str]]) -> range:
+    self.header = self.trim(values[0]) if values else []
+    self.row_count = 0
+    self.digest = hashlib.sha1()
+    self.decoder = None
+    self.store = OrderStore()
+    self.user_index = UserOrderIndex(self.store)
+    self.day_index = DayOrderIndex(self.store)
+    return self.ingest(values[1:])
+
+  def ingest(self, rows: List[List[str]]) -> range:
+    start = len(self.store)
+    if not rows:
+      return range(start, start)
+    if self.decoder is None:
+      self.decoder = RowDecoder(
+        "orders", self.header, order_fields, strict_decoding
+      )
+    self.store.extend(self.decoder.values(rows, self.row_count + 2))
+    added = range(start, len(self.store))
+    self.user_index.add(added)
+    self.day_index.add(added)
+    self.row_count += len(rows)
+    self.last_row = self.pad(rows[-1])
+    self.hash(rows, self.digest)
+    return added
+
+  def hash(self, rows: List[List[str]], digest: Any = None) -> Any:
+    """Adds the rows to the digest, a new one by default."""
+    digest = value_or(digest, hashlib.sha1())
+    for row in rows:
+      digest.update(json.dumps(self.pad(row)).encode())
+    return digest
+
+  def pad(self, row: List[str]) -> List[str]:
+    width = len(self.header)
+    return (row + [""] * (width - len(row)))[:width]
+
+  @staticmethod
+  def trim(row: List[str]) -> List[str]:
+    while row and row[-1] == "":
+      row = row[:-1]
+    return row
+
+
+class SheetFetch:
+  """Everything read from the spreadsheet by one refresh.
+
+  changed holds the titles of the worksheets that differ from the previous
+  fetch; the others come with the objects decoded back then.
+  """
+
+  def __init__(
+    self,
+    users: List[User],
+    items: Dict[str, Item],
+    admin_data: Dict[str, Any],
+    reloaded: bool,
+    store: OrderStore,
+    rows: range,
+    changed: Set[str]
+  ):
+    self.users = users
+    self.items = items
+    self.admin_data = admin_data
+    self.reloaded = reloaded
+    self.store = store
+    self.rows = rows
+    self.changed = changed
+
+
+class SheetRepository(Repository):
+  """The OBHonestyData Google spreadsheet.
+
+  A refresh first asks Drive when the spreadsheet was last modified, and
+  reads nothing more if that did not change since the last read, unless
+  that read is sheet_recheck_seconds old. Otherwise the users, items and
+  admin worksheets are read in full, but only decoded again when their
+  values differ from the last ones.
+  """
+
+  def __init__(self):
+    self.order_sync = OrderSync()
+    # The last values read from each worksheet and what they decoded to
+    self.decoded: Dict[str, Tuple[List[List[str]], Any]] = {}
+    self.modified: Optional[str] = None
+    # Writes made by this process, which Drive may not report right away
+    self.writes = 0
+    self.fetched_at = float("-inf")
+    self.snapshot: Optional[Snapshot] = None
+    # Held by the close-out running in this process
+    self.closing = threading.Lock()
+
+  def modified_time(self) -> Optional[str]:
+    """When the spreadsheet last changed, or None if unknown."""
+    if sheet_recheck_seconds <= 0:
+      return None
+    try:
+      return sheets.modified_time()
+    except Exception as e:
+      print(f"Failed to read the spreadsheet's modified time: {e}")
+      return None
+
+  def unchanged(self, modified: Optional[str]) -> bool:
+    return modified is not None and modified == self.modified and \
+      len(self.decoded) == 3 and \
+      time.monotonic() - self.fetched_at < sheet_recheck_seconds
+
+  def reuse(
+    self, title: str, values: List[List[str]],
+    build: Callable[[List[List[str]]], Any], changed: Set[str]
+  ) -> Any:
+    """The worksheet decoded by build, or as before if it is unchanged."""
+    last = self.decoded.get(title)
+    if last is not None and last[0] == values:
+      return last[1]
+    changed.add(title)
+    decoded = build(values)
+    self.decoded[title] = (values, decoded)
+    return decoded
+
+  def fetch(self) -> SheetFetch:
+    """Reads users, items, admin settings and new orders in one request.
+
+    Only if the orders worksheet changed underneath the sync is a second
+    request made, for all orders.
+    """
+    writes = self.writes
+    modified = self.modified_time()
+    store = self.order_sync.store
+    if self.unchanged(modified):
+      return SheetFetch(
+        users=self.decoded["users"][1],
+        items=self.decoded["items"][1],
+        admin_data=self.decoded["admin"][1],
+        reloaded=False,
+        store=store,
+        rows=range(len(store), len(store)),
+        changed=set()
+      )
+    fetched_at = time.monotonic()
+    values = sheets.values(
+      ["users", "items", "admin"] + self.order_sync.ranges()
+    )
+    rows = self.order_sync.apply(values[3:])
+    reloaded = self.order_sync.store is not store
+    if rows is None:
+      print("Orders worksheet changed, reloading all orders")
+      reloaded = True
+      rows = self.order_sync.apply(sheets.values(self.order_sync.ranges()))
+    changed = {"orders"} if reloaded or len(rows) > 0 else set()
+    user_values, item_values, admin_values = values[:3]
+    fetch = SheetFetch(
+      users=self.reuse("users", user_values, self.decode_users, changed),
+      items=self.reuse("items", item_values, self.decode_items, changed),
+      admin_data=self.reuse(
+        "admin", admin_values, self.decode_admin, changed
+      ),
+      reloaded=reloaded,
+      store=self.order_sync.store,
+      rows=rows,
+      changed=changed
+    )
+    self.modified = modified if self.writes == writes else None
+    self.fetched_at = fetched_at
+    return fetch
+
+  def decode_users(self, values: List[List[str]]) -> List[User]:
+    users = [
+      x for x in self.decode("users", values, user_fields, User)
+      if x.nick_name != ''
+    ]
+    users.sort(key=lambda x: x.nick_name)
+    return users
+
+  def decode_items(self, values: List[List[str]]) -> Dict[str, Item]:
+    return {
+      x.name : x
+      for x in self.decode("items", values, item_fields, Item)
+      if x.name != ''
+    }
+
+  def decode_admin(self, values: List[List[str]]) -> Dict[str, Any]:
+    header, rows = self.split(values)
+    return dict(zip(header, numericise_all(rows[0])))
+
+  def decode(
+    self, title: str, values: List[List[str]], fields: List[Any], model: Any
+  ) -> List[Any]:
+    header, rows = self.split(values)
+    return RowDecoder(title, header, fields, strict_decoding).decode(
+      model, rows
+    )
+
+  @staticmethod
+  def split(values: List[List[str]]) -> Tuple[List[str], List[List[str]]]:
+    return (values[0] if values else []), values[1:]
+
+  def load_snapshot(self) -> Snapshot:
+    """A new snapshot, or the last one if no worksheet changed."""
+    fetch = self.fetch()
+    if self.snapshot is not None and not fetch.changed:
+      return self.snapshot
+    print(f"Reloading sheet data, changed: {', '.join(sorted(fetch.changed))}")
+    self.snapshot = Snapshot(
+      users=fetch.users,
+      items=fetch.items,
+      store=self.order_sync.store,
+      admin_data=fetch.admin_data,
+      user_index=self.order_sync.user_index,
+      day_index=self.order_sync.day_index
+    )
+    return self.snapshot
+
+  def written(self):
+    """Makes the next fetch read, as Drive may report the write late."""
+    self.writes += 1
+    self.modified = None
+
+  def forget(self):
+    """Makes the next fetch read and decode every worksheet in full."""
+    self.order_sync = OrderSync()
+    self.decoded = {}
+    self.modified = None
+
+  def append_orders(self, rows: List[List[Any]]):
+    try:
+      sheets.append_rows("orders", rows)
+    finally:
+      self.written()
+
+  def append_user(self, row: List[Any]):
+    sheets.append_rows("users", [row])
+    self.written()
+
+  def stored_order_ids(self, order_ids: List[str]) -> Set[str]:
+    wanted = set(order_ids)
+    (column,) = sheets.values(["orders!A2:A"])
+    return {x[0] for x in column if x and x[0] in wanted}
+
+  def load_archive(self) -> OrderStore:
+    try:
+      sheets.worksheet("archive")
+    except WorksheetNotFound:
+      return OrderStore()
+    header, rows = self.split(sheets.values(["archive"])[0])
+    return OrderStore(
+      RowDecoder("archive", header, order_fields, strict_decoding).values(rows)
+    )
+
+  def close_period(self, until: date) -> int:
+    """Closes the leading orders placed before the given day.
+
+    The orders worksheet is in time order, so the closed orders are the
+    rows at its top. One batch update, which Google applies entirely or not
+    at all, appends them to the archive worksheet, adds them to the owes
+    column of the users worksheet and deletes them. Right before it, the
+    closed rows and the users are read again, and the close-out is refused
+    if they changed meanwhile. Close-outs of this process run one at a time.
+    """
+    with self.closing:
+      try:
+        return self.close(until)
+      finally:
+        self.written()
+
+  def close(self, until: date) -> int:
+    # Unformatted, so the archived numbers stay numbers
+    order_values, user_values = sheets.values(
+      ["orders", "users"], unformatted=True
+    )
+    order_header, order_rows = self.split(order_values)
+    closed = 0
+    order_ids: List[str] = []
+    totals: Dict[str, float] = {}
+    for order in to_records("orders", order_header, order_rows, order_headers):
+      timestamp = safe_datetime_convert(order['time'])
+      if timestamp is None or timestamp.date() >= until:
+        break
+      totals[order['user']] = totals.get(order['user'], 0.0) + \
+        value_or(safe_float_convert(order['total']), 0.0)
+      order_ids.append(order['order_id'])
+      closed += 1
+    if closed == 0:
+      return 0
+    user_header, user_rows = self.split(user_values)
+    users = to_records("users", user_header, user_rows, user_headers)
+    unknown = unknown_users(totals, [x['nick_name'] for x in users])
+    if unknown:
+      raise ValueError(f"Orders of unknown users {unknown} cannot be closed")
+    owes = [
+      [value_or(safe_float_convert(x['owes']), 0.0) +
+        totals.get(x['nick_name'], 0.0)]
+      for x in users
+    ]
+    column = user_header.index('owes')
+    archive = sheets.worksheet_or_create("archive", order_header)
+    id_column = order_header.index('order_id') + 1
+    id_values, user_values_now = sheets.values([
+      f"orders!{rowcol_to_a1(2, id_column)}:"
+      f"{rowcol_to_a1(closed + 1, id_column)}",
+      "users"
+    ], unformatted=True)
+    if [x[0] if x else "" for x in id_values] != order_ids or \
+        user_values_now != user_values:
+      raise ValueError(
+        "Orders or users changed during the close-out, please try again"
+      )
+    sheets.batch_update(["archive", "users", "orders"], [
+      {"appendCells": {
+        "sheetId": archive.id,
+        "rows": [row_data(x) for x in order_rows[:closed]],
+        "fields": "userEnteredValue"
+      }},
+      {"updateCells": {
+        "range": {
+          "sheetId": sheets.worksheet("users").id,
+          "startRowIndex": 1,
+          "endRowIndex": len(users) + 1,
+          "startColumnIndex": column,
+          "endColumnIndex": column + 1
+        },
+        "rows": [row_data(x) for x in owes],
+        "fields": "userEnteredValue"
+      }},
+      {"deleteDimension": {"range": {
+        "sheetId": sheets.worksheet("orders").id,
+        "dimension": "ROWS",
+        "startIndex": 1,
+        "endIndex": closed + 1
+      }}}
+    ])
+    return closed
+
+
+order_columns = ", ".join(f'"{x}"' for x in order_headers)
+# Orders placed before a day; those without a valid time are never closed,
+# as on the spreadsheet
+closable = (
+  "day glob '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' and day < ?"
+)
+user_placeholders = ", ".join("?" * len(user_headers))
+
+# The database tables have the worksheet headers as columns
+user_decoder = RowDecoder("users", user_headers, user_fields)
+item_decoder = RowDecoder("items", item_headers, item_fields)
+order_decoder = RowDecoder("orders", order_headers, order_fields)
+
+
+class SqliteSnapshot(Snapshot):
+  """A snapshot answering order queries from the SQLite indexes."""
+
+  def __init__(
+    self,
+    repository: "SqliteRepository",
+    users: List[User],
+    items: Dict[str, Item],
+    admin_data: Dict[str, Any]
+  ):
+    self.repository = repository
+    self.users = users
+    self.items = items
+    self.admin_data = admin_data
+
+  def order_store(self) -> OrderStore:
+    return OrderStore(
+      order_decoder.values(self.repository.select_rows("1 order by row"))
+    )
+
+  def order_versions(self) -> Tuple[Any, Any]:
+    return self.repository.order_versions()
+
+  def user_orders(
+    self, nick_name: str, start: int = 0, stop: Optional[int] = None
+  ) -> List[Order]:
+    limit = -1 if stop is None else max(stop - start, 0)
+    return self.repository.select_orders(
+      '"user" = ? order by time desc limit ? offset ?', nick_name, limit, start
+    )
+
+  def order_count(self) -> int:
+    with self.repository.lock:
+      return self.repository.db.execute(
+        "select count(*) from orders"
+      ).fetchone()[0]
+
+  def user_order_count(self, nick_name: str) -> int:
+    with self.repository.lock:
+      return self.repository.db.execute(
+        'select count(*) from orders where "user" = ?', (nick_name,)
+      ).fetchone()[0]
+
+  def user_total(self, nick_name: str) -> float:
+    return self.repository.select_total('"user" = ?', nick_name)
+
+  def orders_on(self, day: date, item: str) -> List[Order]:
+    return self.repository.select_orders(
+      "day = ? and item = ? order by row", day.isoformat(), item
+    )
+
+
+class SqliteRepository(Repository):
+  """A local SQLite database with indexes for the order queries.
+
+  With a mirror, the database follows the given repository: each snapshot
+  load first pulls users, items, admin settings and the new orders from it,
+  and writes go to it. While the spreadsheet cannot be reached, snapshots
+  are served from the local copy. Without a mirror, the database is
+  authoritative.
+  """
+
+  def __init__(self, path: str, mirror: Optional[SheetRepository] = None):
+    self.mirror = mirror
+    self.lock = threading.Lock()
+    # Commits of this process, which data_version does not count
+    self.changes = 0
+    self.db = sqlite3.connect(
+      path, timeout=30, isolation_level=None, check_same_thread=False
+    )
+    self.db.execute("pragma journal_mode=wal")
+    self.db.execute(
+      "create table if not exists users ("
+      + ", ".join(f'"{x}" text' for x in user_headers)
+      + ", primary key (nick_name))"
+    )
+    self.db.execute(
+      "create table if not exists items ("
+      + ", ".join(f'"{x}" text' for x in item_headers)
+      + ", primary key (name))"
+    )
+    self.db.execute(
+      "create table if not exists orders (row integer primary key, "
+      + ", ".join(f'"{x}" text' for x in order_headers)
+      + ", day text)"
+    )
+    self.db.execute(
+      "create index if not exists orders_user on orders (\"user\", time)"
+    )
+    self.db.execute(
+      "create index if not exists orders_day on orders (day, item)"
+    )
+    self.db.execute(
+      "create table if not exists archive as select * from orders where 0"
+    )
+    self.db.execute(
+      "create table if not exists admin (key text primary key, value text)"
+    )
+
+  def select_rows(self, where: str, *args: Any) -> List[Tuple[Any, ...]]:
+    with self.lock:
+      return self.db.execute(
+        f"select {order_columns} from orders where {where}", args
+      ).fetchall()
+
+  def select_orders(self, where: str, *args: Any) -> List[Order]:
+    return order_decoder.decode(Order, self.select_rows(where, *args))
+
+  def select_total(self, where: str, *args: Any) -> float:
+    with self.lock:
+      return self.db.execute(
+        f"select coalesce(sum(cast(total as real)), 0.0) from orders "
+        f"where {where}", args
+      ).fetchone()[0]
+
+  def order_versions(self) -> Tuple[Any, Any]:
+    """Markers that change with the orders and with the archived orders.
+
+    The archive table only grows, by close-outs. A mirror's archive is in
+    the spreadsheet instead, where a close-out makes the sync reload all
+    orders into a new store.
+    """
+    with self.lock:
+      data_version = self.db.execute("pragma data_version").fetchone()[0]
+      archived = self.db.execute("select max(rowid) from archive").fetchone()[0]
+      orders = (data_version, self.changes)
+    if self.mirror is not None:
+      return orders, self.mirror.order_sync.store
+    return orders, archived
+
+  def load_snapshot(self) -> Snapshot:
+    if self.mirror is not None:
+      try:
+        self.pull()
+      except (SheetsUnavailable, APIError, RequestException) as e:
+        print(f"Failed to pull the spreadsheet, serving the local copy: {e}")
+    with self.lock:
+      user_rows = self.db.execute(
+        "select * from users order by nick_name"
+      ).fetchall()
+      item_rows = self.db.execute("select * from items").fetchall()
+      admin_rows = self.db.execute("select key, value from admin").fetchall()
+    return SqliteSnapshot(
+      repository=self,
+      users=user_decoder.decode(User, user_rows),
+      items={x.name : x for x in item_decoder.decode(Item, item_rows)},
+      admin_data={key: json.loads(value) for key, value in admin_rows}
+    )
+
+  def pull(self):
+    """Copies the mirrored repository into the database.
+
+    A fetch moves the mirror's sync past the rows it read, so after a pull
+    that failed anywhere, the next one copies everything again.
+    """
+    try:
+      self.copy(self.mirror.fetch())
+    except:
+      self.mirror.forget()
+      raise
+
+  def copy(self, fetch: SheetFetch):
+    if not fetch.changed:
+      return
+    with self.lock:
+      self.db.execute("begin")
+      try:
+        if "users" in fetch.changed:
+          self.db.execute("delete from users")
+          self.db.executemany(
+            f"insert or replace into users values ({user_placeholders})",
+            [self.user_row(x) for x in fetch.users]
+          )
+        if "items" in fetch.changed:
+          self.db.execute("delete from items")
+          self.db.executemany(
+            "insert or replace into items values (?, ?, ?, ?)",
+            [(x.name, x.price, x.description, x.tax_category)
+              for x in fetch.items.values()]
+          )
+        if "admin" in fetch.changed:
+          self.db.execute("delete from admin")
+          self.db.executemany(
+            "insert into admin values (?, ?)",
+            [(key, json.dumps(value))
+              for key, value in fetch.admin_data.items()]
+          )
+        if fetch.reloaded:
+          self.db.execute("delete from orders")
+        self.insert_orders([fetch.store.row(x) for x in fetch.rows])
+        self.db.execute("commit")
+      except:
+        self.db.execute("rollback")
+        raise
+      self.changes += 1
+
+  def insert_orders(self, rows: List[List[Any]]):
+    self.db.executemany(
+      f"insert into orders ({order_columns}, day) "
+      f"values ({', '.join('?' * (len(order_headers) + 1))})",
+      [list(x) + [str(x[2])[:10]] for x in rows]
+    )
+
+  def append_orders(self, rows: List[List[Any]]):
+    if self.mirror is not None:
+      return self.mirror.append_orders(rows)
+    with self.lock:
+      self.insert_orders(rows)
+      self.changes += 1
+
+  def append_user(self, row: List[Any]):
+    if self.mirror is not None:
+      return self.mirror.append_user(row)
+    row = list(row) + [""] * (len(user_headers) - len(row))
+    with self.lock:
+      try:
+        self.db.execute(
+          f"insert into users values ({user_placeholders})",
+          row[:len(user_headers)]
+        )
+      except sqlite3.IntegrityError:
+        raise ValueError(f"The nick name '{row[0]}' is already taken")
+
+  def stored_order_ids(self, order_ids: List[str]) -> Set[str]:
+    if self.mirror is not None:
+      return self.mirror.stored_order_ids(order_ids)
+    with self.lock:
+      return {x for (x,) in self.db.execute(
+        "select order_id from orders "
+        "where order_id in (select value from json_each(?))",
+        (json.dumps(order_ids),)
+      )}
+
+  def load_archive(self) -> OrderStore:
+    if self.mirror is not None:
+      return self.mirror.load_archive()
+    with self.lock:
+      rows = self.db.execute(
+        f"select {order_columns} from archive order by row"
+      ).fetchall()
+    return OrderStore(order_decoder.values(rows))
+
+  def close_period(self, until: date) -> int:
+    if self.mirror is not None:
+      return self.mirror.close_period(until)
+    day = until.isoformat()
+    with self.lock:
+      self.db.execute("begin immediate")
+      try:
+        totals = dict(self.db.execute(
+          'select "user", sum(cast(total as real)) from orders '
+          f'where {closable} group by "user"', (day,)
+        ).fetchall())
+        users = [x for (x,) in self.db.execute("select nick_name from users")]
+        unknown = unknown_users(totals, users)
+        if unknown:
+          raise ValueError(
+            f"Orders of unknown users {unknown} cannot be closed"
+          )
+        self.db.executemany(
+          "update users set owes = coalesce(cast(owes as real), 0.0) + ? "
+          "where nick_name = ?",
+          [(total, user) for user, total in totals.items()]
+        )
+        self.db.execute(
+          f"insert into archive select * from orders where {closable}", (day,)
+        )
+        closed = self.db.execute(
+          f"delete from orders where {closable}", (day,)
+        ).rowcount
+        self.db.execute("commit")
+      except:
+        self.db.execute("rollback")
+        raise
+      self.changes += 1
+    return closed
+
+  @staticmethod
+  def user_row(user: User) -> List[Any]:
+    return [
+      user.nick_name, user.first_name, user.last_name, user.phone_number,
+      user.email, user.address, "yes" if user.volunteer else "no",
+      "yes" if user.away else "no", user.diet, user.allergies, user.owes
+    ]
+
+
+def make_repository(backend: str) -> Repository:
+  if backend == "sheets":
+    return SheetRepository()
+  if backend == "sqlite":
+    return SqliteRepository(database_path)
+  if backend == "mirror":
+    return SqliteRepository(database_path, mirror=SheetRepository())
+  raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+repository = make_repository(storage_backend)
+snapshot_cache = SnapshotCache(repository.load_snapshot, snapshot_ttl_seconds)
+metrics.snapshot_age.set_function(snapshot_cache.age)
+metrics.snapshot_rows.labels("users").set_function(
+  lambda: len(snapshot_cache.current().users)
+)
+metrics.snapshot_rows.labels("items").set_function(
+  lambda: len(snapshot_cache.current().items)
+)
+metrics.snapshot_rows.labels("orders").set_function(
+  lambda: snapshot_cache.current().order_count()
+)
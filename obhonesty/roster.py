@@ -0,0 +1,129 @@
+import asyncio
+from datetime import date, datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import reflex as rx
+
+from obhonesty.journal import order_journal
+from obhonesty.order import Order
+from obhonesty.repository import snapshot_cache
+from obhonesty.snapshot import Snapshot, order_day
+
+def orders_on(snapshot: Snapshot, day: date, item: str) -> List[Order]:
+  """Stored and still journaled orders of one item on the given day."""
+  pending = [
+    x for x in order_journal.pending_orders()
+    if x.item == item and order_day(x) == day
+  ]
+  return snapshot.orders_on(day, item) + pending
+
+
+def breakfast_signups(snapshot: Snapshot, day: date) -> List[Order]:
+  """The day's breakfast sign-ups, latest first, timed to the second."""
+  signups: List[Order] = []
+  for order in orders_on(snapshot, day, "Breakfast sign-up"):
+    order_alt = order.copy()
+    order_alt.time = order.timestamp.strftime("%H:%M:%S")
+    signups.append(order_alt)
+  signups.sort(key=lambda x: x.time, reverse=True)
+  return signups
+
+
+def signup_version() -> Tuple[int, Tuple[int, int]]:
+  """Changes whenever the sign-ups may have changed.
+
+  That is on each snapshot refresh and each journal change, including
+  orders journaled by other processes.
+  """
+  return snapshot_cache.generation, order_journal.version()
+
+
+class SignupFeed:
+  """Wakes the sign-up watches of open admin screens.
+
+  Sign-up handlers notify it once their row is journaled. A watch takes the
+  current event with listen() before it reads the sign-ups, so a sign-up
+  made while it reads still wakes it. Both run on the event loop.
+  """
+
+  def __init__(self):
+    self.event: Optional[asyncio.Event] = None
+    # Whether a client token still has a connected socket, set by the app
+    self.is_connected: Callable[[str], bool] = lambda token: True
+
+  def listen(self) -> asyncio.Event:
+    if self.event is None:
+      self.event = asyncio.Event()
+    return self.event
+
+  def notify(self):
+    if self.event is not None:
+      self.event.set()
+      self.event = None
+
+  @staticmethod
+  async def wait(event: asyncio.Event, timeout: float):
+    """Waits for the event, or the timeout."""
+    try:
+      await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+      pass
+
+
+signup_feed = SignupFeed()
+
+
+class DinnerRoster(rx.Base):
+  signups: List[Order]
+  count: int
+  vegan: int
+  vegetarian: int
+  meat: int
+
+  @staticmethod
+  def build(snapshot: Snapshot, day: date) -> "DinnerRoster":
+    signups = orders_on(snapshot, day, "Dinner sign-up")
+    for user in snapshot.users:
+      if user.volunteer:
+        signups.append(Order(order_id="",
+          user_nick_name=user.nick_name, time="",
+          item="Dinner sign-up (volunteer)",
+          quantity=1.0, price=0.0, total=0.0,
+          receiver=user.full_name, diet=user.diet,
+          allergies=user.allergies, served="", tax_category="",
+          comment="yes"
+        ))
+    diets: Dict[str, int] = {}
+    for signup in signups:
+      diets[signup.diet] = diets.get(signup.diet, 0) + 1
+    signups.sort(key=lambda x: (x.comment, x.diet, x.receiver))
+    return DinnerRoster(
+      signups=signups,
+      count=len(signups),
+      vegan=diets.get("Vegan", 0),
+      vegetarian=diets.get("Vegetarian", 0),
+      meat=diets.get("Meat", 0)
+    )
+
+
+class DinnerRosterCache:
+  """Today's dinner roster, rebuilt only when the data or the day changes."""
+
+  def __init__(self):
+    self.key: Optional[Any] = None
+    self.roster: Optional[DinnerRoster] = None
+    self.lock = threading.Lock()
+
+  def get(self) -> DinnerRoster:
+    snapshot = snapshot_cache.current()
+    day = datetime.today().date()
+    key = (snapshot, day, order_journal.version())
+    with self.lock:
+      if self.roster is None or key != self.key:
+        self.roster = DinnerRoster.build(snapshot, day)
+        self.key = key
+      return self.roster
+
+
+dinner_rosters = DinnerRosterCache()
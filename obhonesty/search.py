@@ -0,0 +1,139 @@
+from bisect import bisect_left, insort
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from obhonesty.repository import snapshot_cache
+from obhonesty.snapshot import Snapshot
+from obhonesty.user import User
+
+def name_terms(user: User) -> Set[str]:
+  """The lowercase words of a user's nick, first and last name."""
+  return {
+    x for name in (user.nick_name, user.first_name, user.last_name)
+    for x in name.lower().split()
+  }
+
+def trigrams(term: str) -> Set[str]:
+  return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+class UserSearchIndex:
+  """Finds users by any part of their nick, first or last name.
+
+  A query word of three or more characters is looked up by its trigrams:
+  the users holding all of them are checked for the whole word. Shorter
+  words are looked up as prefixes of the sorted name words. Users are added
+  and removed one at a time, so the index never needs a rebuild.
+  """
+
+  def __init__(self):
+    self.users: Dict[str, User] = {}
+    self.nick_names: List[str] = []
+    self.terms: Dict[str, Set[str]] = {}
+    # Sorted (term, nick name) pairs for the prefix lookups
+    self.words: List[Tuple[str, str]] = []
+    # Nick names by the trigrams of their terms
+    self.postings: Dict[str, Set[str]] = {}
+
+  def add(self, user: User):
+    nick_name = user.nick_name
+    if nick_name in self.users:
+      self.remove(nick_name)
+    self.users[nick_name] = user
+    insort(self.nick_names, nick_name)
+    terms = self.terms[nick_name] = name_terms(user)
+    for term in terms:
+      insort(self.words, (term, nick_name))
+      for trigram in trigrams(term):
+        self.postings.setdefault(trigram, set()).add(nick_name)
+
+  def remove(self, nick_name: str):
+    del self.users[nick_name]
+    del self.nick_names[bisect_left(self.nick_names, nick_name)]
+    for term in self.terms.pop(nick_name):
+      del self.words[bisect_left(self.words, (term, nick_name))]
+      for trigram in trigrams(term):
+        postings = self.postings[trigram]
+        postings.discard(nick_name)
+        if not postings:
+          del self.postings[trigram]
+
+  def sync(self, users: List[User], keep: Set[str]):
+    """Adds, updates and removes users to match the given ones.
+
+    Users in keep are not removed, even if they are not given.
+    """
+    given = {x.nick_name: x for x in users}
+    for nick_name in [x for x in self.users if x not in given]:
+      if nick_name not in keep:
+        self.remove(nick_name)
+    for nick_name, user in given.items():
+      if self.users.get(nick_name) != user:
+        self.add(user)
+
+  def matches(self, word: str) -> Set[str]:
+    if len(word) < 3:
+      matched: Set[str] = set()
+      for term, nick_name in self.words[bisect_left(self.words, (word, "")):]:
+        if not term.startswith(word):
+          break
+        matched.add(nick_name)
+      return matched
+    candidates = set.intersection(
+      *(self.postings.get(x, set()) for x in trigrams(word))
+    )
+    return {
+      x for x in candidates if any(word in term for term in self.terms[x])
+    }
+
+  def search(self, query: str) -> List[User]:
+    """Users matching every word of the query, by nick name."""
+    words = query.lower().split()
+    if not words:
+      return [self.users[x] for x in self.nick_names]
+    matched = set.intersection(*(self.matches(x) for x in words))
+    return [self.users[x] for x in sorted(matched)]
+
+
+class UserSearch:
+  """The search index of the current snapshot's users.
+
+  The index follows each new snapshot by its differences. Users signed up
+  through this process are added right away and kept until a snapshot has
+  them.
+  """
+
+  def __init__(self):
+    self.snapshot: Optional[Snapshot] = None
+    self.index = UserSearchIndex()
+    self.signed_up: Set[str] = set()
+    self.lock = threading.Lock()
+
+  def update(self):
+    snapshot = snapshot_cache.current()
+    if snapshot is self.snapshot:
+      return
+    # A snapshot of new orders only keeps the users of the last one
+    if self.snapshot is None or snapshot.users is not self.snapshot.users:
+      self.signed_up -= {x.nick_name for x in snapshot.users}
+      self.index.sync(snapshot.users, self.signed_up)
+    self.snapshot = snapshot
+
+  def search(self, query: str) -> List[User]:
+    with self.lock:
+      self.update()
+      return self.index.search(query)
+
+  def user(self, nick_name: str) -> Optional[User]:
+    with self.lock:
+      self.update()
+      return self.index.users.get(nick_name)
+
+  def add(self, user: User):
+    with self.lock:
+      self.update()
+      self.signed_up.add(user.nick_name)
+      self.index.add(user)
+
+
+user_search = UserSearch()
@@ -1,8 +1,286 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
 import gspread
+from gspread.exceptions import APIError, WorksheetNotFound
+from requests.exceptions import ConnectionError, Timeout
+
+from obhonesty import metrics
+from obhonesty.constants import (
+  sheets_reads_per_minute, sheets_writes_per_minute
+)
+from obhonesty.tracing import tracer
+
+class SheetsUnavailable(Exception):
+  """Raised instead of calling Google while the circuit breaker is open."""
+
+
+class TokenBucket:
+  """Allows a number of calls per minute, in bursts of up to that number."""
+
+  def __init__(self, per_minute: float):
+    self.capacity = per_minute
+    self.rate = per_minute / 60.0
+    self.tokens = per_minute
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def acquire(self) -> float:
+    """Takes a token, waiting until one is available; returns the wait."""
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(
+        self.capacity, self.tokens + (now - self.updated) * self.rate
+      )
+      self.updated = now
+      self.tokens -= 1
+      wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+    if wait > 0:
+      time.sleep(wait)
+    return wait
+
+
+class CircuitBreaker:
+  """Opens after consecutive failures and lets one trial call through per
+  cooldown until a call succeeds again."""
+
+  def __init__(self, threshold: int, cooldown: float):
+    self.threshold = threshold
+    self.cooldown = cooldown
+    self.failures = 0
+    self.opened_at: Optional[float] = None
+    self.lock = threading.Lock()
+
+  @property
+  def open(self) -> bool:
+    return self.opened_at is not None
+
+  def allow(self) -> bool:
+    with self.lock:
+      if self.opened_at is None:
+        return True
+      if time.monotonic() - self.opened_at >= self.cooldown:
+        self.opened_at = time.monotonic()
+        return True
+      return False
+
+  def record_success(self):
+    with self.lock:
+      if self.opened_at is not None:
+        print("Google Sheets is reachable again, closing the circuit")
+      self.failures = 0
+      self.opened_at = None
+
+  def record_failure(self):
+    with self.lock:
+      self.failures += 1
+      if self.failures >= self.threshold and self.opened_at is None:
+        print(f"Google Sheets failed {self.failures} times, opening circuit")
+        self.opened_at = time.monotonic()
+
+
+def retryable(error: Exception) -> bool:
+  if isinstance(error, APIError):
+    return error.code == 429 or error.code >= 500
+  return isinstance(error, (ConnectionError, Timeout))
+
+def throttled(error: Exception) -> bool:
+  return isinstance(error, APIError) and error.code == 429
+
+def row_data(values: List[Any]) -> Dict[str, Any]:
+  """A row of values as the cells of a batch update request."""
+  def cell(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+      return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)):
+      return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+  return {"values": [cell(x) for x in values]}
+
+def error_code(error: Exception) -> str:
+  """The HTTP status of an API error, or the kind of any other error."""
+  if isinstance(error, APIError):
+    return str(error.code)
+  return type(error).__name__
+
+
+class Sheets:
+  """Handles to the spreadsheet's worksheets, opened on first use.
+
+  Nothing touches the network at import time. The first caller, or the
+  background warm-up, connects; concurrent callers wait for that one
+  connection instead of opening their own.
+
+  Every call to Google goes through call(), which keeps reads and writes
+  within the per-minute quota, retries throttled and failed calls with
+  jittered exponential backoff, and stops calling Google altogether while
+  the circuit breaker is open. Writes are only retried when throttled: any
+  other failure may have come after Google applied the write, so retrying
+  is left to callers that can tell, like the order journal. Outcomes are
+  tallied in counters, and every call's latency and error code in the
+  worksheet's metrics.
+  """
+
+  titles = ("users", "items", "orders", "admin")
+  retries = 4
+  backoff_base = 1.0
+  backoff_cap = 32.0
+
+  def __init__(self, name: str):
+    self.name = name
+    self.spreadsheet: Optional[gspread.Spreadsheet] = None
+    self.worksheets: Dict[str, gspread.Worksheet] = {}
+    self.lock = threading.Lock()
+    # Held while connecting, apart from self.lock, which call() takes
+    self.connecting = threading.Lock()
+    self.read_bucket = TokenBucket(sheets_reads_per_minute)
+    self.write_bucket = TokenBucket(sheets_writes_per_minute)
+    self.breaker = CircuitBreaker(threshold=5, cooldown=30.0)
+    self.counters: Dict[str, int] = {
+      "calls": 0, "throttled": 0, "retried": 0, "failed": 0, "rejected": 0
+    }
+
+  def count(self, name: str):
+    with self.lock:
+      self.counters[name] += 1
+    metrics.sheets_outcomes.labels(name).inc()
+
+  @staticmethod
+  def record(
+    title: str, operation: str, start: float,
+    error: Optional[Exception] = None
+  ):
+    metrics.sheets_calls.labels(title, operation).inc()
+    metrics.sheets_seconds.labels(title, operation).observe(
+      time.perf_counter() - start
+    )
+    if error is not None:
+      metrics.sheets_errors.labels(title, operation, error_code(error)).inc()
+
+  def call(
+    self, title: str, write: bool, fn: Callable[..., Any], *args, **kwargs
+  ) -> Any:
+    """Calls Google for the given worksheets, or "" for the spreadsheet."""
+    if not self.breaker.allow():
+      self.count("rejected")
+      raise SheetsUnavailable(f"{self.name} is unavailable, try again later")
+    bucket = self.write_bucket if write else self.read_bucket
+    operation = getattr(fn, "__name__", "call")
+    for attempt in range(self.retries + 1):
+      if bucket.acquire() > 0:
+        self.count("throttled")
+      self.count("calls")
+      start = time.perf_counter()
+      try:
+        with tracer.span(
+          "sheets", "sheets",
+          worksheet=title, operation=operation, attempt=attempt
+        ):
+          result = fn(*args, **kwargs)
+      except Exception as e:
+        self.record(title, operation, start, e)
+        if not retryable(e):
+          raise
+        self.breaker.record_failure()
+        if attempt == self.retries or self.breaker.open or \
+            (write and not throttled(e)):
+          self.count("failed")
+          raise
+        self.count("retried")
+        time.sleep(random.uniform(
+          0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        ))
+        continue
+      self.record(title, operation, start)
+      self.breaker.record_success()
+      return result
+
+  def open(self) -> gspread.Spreadsheet:
+    spreadsheet = self.spreadsheet
+    if spreadsheet is not None:
+      return spreadsheet
+    with self.connecting:
+      if self.spreadsheet is None:
+        client = self.call("", False, gspread.service_account)
+        spreadsheet = self.call("", False, client.open, self.name)
+        with self.lock:
+          self.spreadsheet = spreadsheet
+      return self.spreadsheet
+
+  def worksheet(self, title: str) -> gspread.Worksheet:
+    worksheet = self.worksheets.get(title)
+    if worksheet is not None:
+      return worksheet
+    spreadsheet = self.open()
+    with self.connecting:
+      if title not in self.worksheets:
+        worksheet = self.call(title, False, spreadsheet.worksheet, title)
+        with self.lock:
+          self.worksheets[title] = worksheet
+      return self.worksheets[title]
+
+  def worksheet_or_create(
+    self, title: str, header: List[str]
+  ) -> gspread.Worksheet:
+    try:
+      return self.worksheet(title)
+    except WorksheetNotFound:
+      worksheet = self.call(
+        title, True, self.open().add_worksheet, title, rows=1, cols=len(header)
+      )
+      self.call(title, True, worksheet.append_row, header)
+      with self.lock:
+        self.worksheets[title] = worksheet
+      return worksheet
+
+  def values(
+    self, ranges: List[str], unformatted: bool = False
+  ) -> List[List[List[Any]]]:
+    """Reads several ranges in a single request.
+
+    Unformatted, numbers come as numbers rather than as their formatted
+    text, while dates and times still come as text.
+    """
+    titles = ",".join(dict.fromkeys(x.partition("!")[0] for x in ranges))
+    params = {
+      "valueRenderOption": "UNFORMATTED_VALUE",
+      "dateTimeRenderOption": "FORMATTED_STRING"
+    } if unformatted else None
+    response = self.call(
+      titles, False, self.open().values_batch_get, ranges, params=params
+    )
+    return [x.get("values", []) for x in response["valueRanges"]]
+
+  def modified_time(self) -> str:
+    """When any worksheet last changed, as Drive reports it."""
+    return self.call("", False, self.open().get_lastUpdateTime)
+
+  def append_rows(self, title: str, rows: List[List[Any]]):
+    self.call(
+      title, True, self.worksheet(title).append_rows, rows, table_range="A1"
+    )
+
+  def batch_update(self, titles: List[str], requests: List[Dict[str, Any]]):
+    """Applies the requests in one call, which Google applies entirely or
+    not at all."""
+    self.call(
+      ",".join(titles), True, self.open().batch_update,
+      {"requests": requests}
+    )
+
+  def connect(self):
+    try:
+      for title in self.titles:
+        self.worksheet(title)
+    except Exception as e:
+      print(f"Failed to connect to the {self.name} spreadsheet: {e}")
+
+  def warm_up(self):
+    """Connects in the background so the first request need not wait."""
+    threading.Thread(target=self.connect, daemon=True).start()
+
 
-gclient = gspread.service_account()
-spreadsheet = gclient.open("OBHonestyData")
-user_sheet = spreadsheet.worksheet("users")
-item_sheet = spreadsheet.worksheet("items")
-order_sheet = spreadsheet.worksheet("orders")
-admin_sheet = spreadsheet.worksheet("admin")
+sheets = Sheets("OBHonestyData")
+metrics.sheets_circuit_open.set_function(lambda: sheets.breaker.open)
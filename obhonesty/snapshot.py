@@ -0,0 +1,172 @@
+from datetime import date
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from obhonesty import metrics
+from obhonesty.index import DayOrderIndex, UserOrderIndex
+from obhonesty.item import Item
+from obhonesty.order import Order
+from obhonesty.order_store import OrderStore
+from obhonesty.tracing import tracer
+from obhonesty.user import User
+
+class Snapshot:
+  """The stored data at one point in time, shared read-only by all sessions."""
+
+  def __init__(
+    self,
+    users: List[User],
+    items: Dict[str, Item],
+    store: OrderStore,
+    admin_data: Dict[str, Any],
+    user_index: Optional[UserOrderIndex] = None,
+    day_index: Optional[DayOrderIndex] = None
+  ):
+    self.users = users
+    self.items = items
+    self.store = store
+    self.admin_data = admin_data
+    if user_index is None:
+      user_index = UserOrderIndex(store, range(len(store)))
+    self.user_index = user_index
+    if day_index is None:
+      day_index = DayOrderIndex(store, range(len(store)))
+    self.day_index = day_index
+
+  def order_store(self) -> OrderStore:
+    return self.store
+
+  def order_versions(self) -> Tuple[Any, Any]:
+    """Markers that change with the orders and with the archived orders.
+
+    A close-out rebuilds the store, so its identity marks the archive.
+    """
+    return (self.store, len(self.store)), self.store
+
+  def order_count(self) -> int:
+    return len(self.store)
+
+  def user(self, nick_name: str) -> Optional[User]:
+    return next((x for x in self.users if x.nick_name == nick_name), None)
+
+  def user_orders(
+    self, nick_name: str, start: int = 0, stop: Optional[int] = None
+  ) -> List[Order]:
+    """Orders of one user, newest first, from start up to stop."""
+    return self.user_index.user_orders(nick_name, start, stop)
+
+  def user_order_count(self, nick_name: str) -> int:
+    return self.user_index.user_order_count(nick_name)
+
+  def user_total(self, nick_name: str) -> float:
+    return self.user_index.user_total(nick_name)
+
+  def orders_on(self, day: date, item: str) -> List[Order]:
+    """Orders of one item placed on the given day."""
+    return self.day_index.orders_on(day, item)
+
+
+def order_day(order: Order) -> Optional[date]:
+  return order.timestamp.date() if order.timestamp is not None else None
+
+
+class SnapshotCache:
+  """Holds one snapshot for the whole process.
+
+  A fresh snapshot is returned as is. A stale one is still returned, while a
+  single background refresh revalidates it. Callers that have no snapshot
+  yet wait for the one refresh in flight instead of starting their own.
+  Callers that force a refresh wait for one that started after their call,
+  so they see their own writes; while a refresh runs, they queue a single
+  follow-up that it starts when it is done. If a refresh fails, the stale
+  snapshot is served when there is one.
+  """
+
+  def __init__(self, fetch: Callable[[], Snapshot], ttl: float):
+    self.fetch = fetch
+    self.ttl = ttl
+    self.snapshot: Optional[Snapshot] = None
+    self.fetched_at = float("-inf")
+    self.error: Optional[Exception] = None
+    self.refreshing = False
+    # Whether a forced caller waits for another refresh after this one
+    self.again = False
+    # Refreshes started and finished so far
+    self.started = 0
+    self.generation = 0
+    self.condition = threading.Condition()
+
+  def current(self) -> Snapshot:
+    """The last snapshot without refreshing it, or an empty one."""
+    if self.snapshot is None:
+      return Snapshot(users=[], items={}, store=OrderStore(), admin_data={})
+    return self.snapshot
+
+  def age(self) -> float:
+    return time.monotonic() - self.fetched_at
+
+  def get(self, force: bool = False) -> Snapshot:
+    with self.condition:
+      if self.snapshot is not None and not force:
+        if self.age() >= self.ttl:
+          self.prefetch()
+        return self.snapshot
+      leader = not self.refreshing
+      if leader:
+        self.refreshing = True
+        self.started += 1
+      elif force:
+        self.again = True
+      # The refresh that has to finish, counted like generation
+      target = self.started + 1 if force and not leader else self.started
+    if leader:
+      self.refresh()
+    with self.condition:
+      while self.generation < target:
+        self.condition.wait()
+      if self.snapshot is None:
+        raise self.error
+      if self.error is not None:
+        print(f"Serving a stale snapshot, refresh failed: {self.error}")
+      return self.snapshot
+
+  def prefetch(self):
+    """Starts a background refresh unless one is in flight."""
+    with self.condition:
+      if not self.refreshing:
+        self.refreshing = True
+        self.started += 1
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+  def refresh(self):
+    """Refreshes the snapshot, again for as long as a follow-up is queued."""
+    while True:
+      snapshot: Optional[Snapshot] = None
+      error: Optional[Exception] = None
+      start = time.perf_counter()
+      try:
+        with tracer.span("snapshot_refresh", "snapshot"):
+          snapshot = self.fetch()
+      except Exception as e:
+        error = e
+        metrics.snapshot_refresh_failures.inc()
+      metrics.snapshot_refresh_seconds.observe(time.perf_counter() - start)
+      with self.condition:
+        if snapshot is not None:
+          self.snapshot = snapshot
+          self.fetched_at = time.monotonic()
+        self.error = error
+        self.generation += 1
+        self.condition.notify_all()
+        if not self.again:
+          self.refreshing = False
+          return
+        self.again = False
+        self.started += 1
+
+  def invalidate(self):
+    """Marks the snapshot stale so the next read revalidates it."""
+    with self.condition:
+      self.fetched_at = float("-inf")
+
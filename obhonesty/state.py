@@ -1,59 +1,290 @@
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import asyncio
+from datetime import date, datetime
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import uuid
 
 import reflex as rx
 
-from obhonesty.user import User
+from obhonesty.user import User, UserCard
 from obhonesty.item import Item
 from obhonesty.order import Order
-from obhonesty.sheet import user_sheet, item_sheet, order_sheet, admin_sheet
+from obhonesty.aux import value_or
+from obhonesty.constants import (
+  breakfast_items, order_page_size, profile_dir, profile_trigger_seconds,
+  signup_grace_seconds, signup_heartbeat_seconds, user_page_size
+)
+from obhonesty.journal import order_journal
+from obhonesty.metrics import computed_var_seconds, timed_handler
+from obhonesty.profiling import profiled, profiler
+from obhonesty.report import ReportRow, order_columns, report_csv
+from obhonesty.repository import repository, snapshot_cache, user_decoder
+from obhonesty.roster import (
+  breakfast_signups, dinner_rosters, signup_feed, signup_version
+)
+from obhonesty.search import user_search
+from obhonesty.sheet import SheetsUnavailable
+from obhonesty.snapshot import Snapshot
+from obhonesty.tracing import traced
+
+# The admin settings that pages show
+settings_keys = [
+  "dinner_price", "dinner_signup_deadline", "breakfast_signup_deadline"
+] + [f"{x}_price" for x in breakfast_items]
+
+def pending_user_orders(nick_name: str) -> List[Order]:
+  return [
+    x for x in order_journal.pending_orders() if x.user_nick_name == nick_name
+  ]
+
+def page_window(total: int, size: int, page: int) -> Tuple[int, int, int]:
+  """The page clamped to the existing ones, the page count and first entry."""
+  count = max(1, -(-total // size))
+  page = min(max(page, 0), count - 1)
+  return page, count, page * size
+
+@computed_var_seconds.labels("user_cards").time()
+def user_card_page(query: str, page: int) -> Dict[str, Any]:
+  """One page of the users matching the search query."""
+  users = user_search.search(query)
+  page, count, start = page_window(len(users), user_page_size, page)
+  return {
+    "user_cards": [
+      UserCard(nick_name=x.nick_name, full_name=x.full_name)
+      for x in users[start:start + user_page_size]
+    ],
+    "user_page": page,
+    "user_page_count": count
+  }
+
+@computed_var_seconds.labels("current_user_orders").time()
+def user_order_page(
+  snapshot: Snapshot, nick_name: str, page: int
+) -> Dict[str, Any]:
+  """One page of the stored and still journaled orders of one user.
+
+  Journaled orders come first, newest first like the stored ones, so the
+  models are only built for the orders on the page.
+  """
+  pending = pending_user_orders(nick_name)
+  pending.sort(key=lambda x: x.time, reverse=True)
+  page, count, start = page_window(
+    len(pending) + snapshot.user_order_count(nick_name), order_page_size, page
+  )
+  stop = start + order_page_size
+  orders = pending[start:stop]
+  if len(orders) < order_page_size:
+    orders += snapshot.user_orders(
+      nick_name, max(start - len(pending), 0), stop - len(pending)
+    )
+  return {
+    "current_user_orders": orders,
+    "order_page": page,
+    "order_page_count": count
+  }
+
+@computed_var_seconds.labels("user_debt").time()
+def user_debt(snapshot: Snapshot, nick_name: str) -> float:
+  user = snapshot.user(nick_name)
+  pending = sum(x.total for x in pending_user_orders(nick_name))
+  return (user.owes if user is not None else 0.0) + \
+    snapshot.user_total(nick_name) + pending
+
+@traced("projection")
+def signup_data(page: str) -> Dict[str, Any]:
+  """Today's sign-ups as the admin dinner or breakfast page shows them."""
+  if page == "/admin/dinner":
+    with computed_var_seconds.labels("dinner_signups").time():
+      roster = dinner_rosters.get()
+    return dict(
+      dinner_signups=roster.signups,
+      dinner_count=roster.count,
+      dinner_count_vegan=roster.vegan,
+      dinner_count_vegetarian=roster.vegetarian,
+      dinner_count_meat=roster.meat
+    )
+  if page == "/admin/breakfast":
+    with computed_var_seconds.labels("breakfast_signups").time():
+      return {
+        "breakfast_signups": breakfast_signups(
+          snapshot_cache.current(), datetime.today().date()
+        )
+      }
+  return {}
+
+@traced("projection")
+def load_session_data(
+  force: bool,
+  page: str,
+  nick_name: Optional[str],
+  query: str,
+  user_page: int,
+  order_page: int
+) -> Dict[str, Any]:
+  """The vars a session renders on the given page, by name.
+
+  The snapshot itself stays on the server. Every page gets its page of the
+  user list, the menu and the settings; the order history, the rosters and
+  the debt only go to the page showing them.
+  """
+  snapshot = snapshot_cache.get(force=force)
+  data: Dict[str, Any] = {
+    **user_card_page(query, user_page),
+    "menu": list(snapshot.items.values()),
+    "settings": {
+      x: snapshot.admin_data[x] for x in settings_keys
+      if x in snapshot.admin_data
+    }
+  }
+  if page == "/info" and nick_name is not None:
+    data.update(user_order_page(snapshot, nick_name, order_page))
+  elif page == "/admin/user" and nick_name is not None:
+    data["user_debt"] = user_debt(snapshot, nick_name)
+  elif page == "/admin/late":
+    data["nick_names"] = [x.nick_name for x in snapshot.users]
+  else:
+    data.update(signup_data(page))
+  return data
+
+def instrumented(fn: Callable[..., Any]) -> Callable[..., Any]:
+  """Times, traces and profiles an event handler; apply it below rx.event."""
+  return profiled(traced("handler")(timed_handler(fn)))
+
+def assign(state: rx.State, data: Dict[str, Any], force: bool = False):
+  """Sets the vars that changed, so unchanged ones are not sent again.
+
+  With force, all are set and sent, for a client that may have missed some.
+  """
+  for name, value in data.items():
+    if force or getattr(state, name) != value:
+      setattr(state, name, value)
+
 
 class State(rx.State):
   """The app state."""
-  admin_data: Dict[str, Any]
-  users: List[User]
-  items: Dict[str, Item]
   current_user: Optional[User]
   new_nick_name: str
   custom_item_price: str
-  orders: List[Order]
+
+  # Projections of the shared snapshot, see load_session_data
+  search_query: str = ""
+  user_cards: List[UserCard] = []
+  user_page: int = 0
+  user_page_count: int = 1
+  nick_names: List[str] = []
+  menu: List[Item] = []
+  settings: Dict[str, Any] = {}
+  current_user_orders: List[Order] = []
+  order_page: int = 0
+  order_page_count: int = 1
+  user_debt: float = 0.0
+  dinner_signups: List[Order] = []
+  dinner_count: int = 0
+  dinner_count_vegan: int = 0
+  dinner_count_vegetarian: int = 0
+  dinner_count_meat: int = 0
+  breakfast_signups: List[Order] = []
+
+  loading: bool = False
+  closing: bool = False
+  # Increased by each sign-up watch started, to stop the one before
+  _signup_watch: int = 0
+  tax_report: List[ReportRow] = []
+  tax_categories: Dict[str, float] = {}
+  report_start: str
+  report_end: str
+  report_period: str = "month"
+
+  @rx.event(background=True)
+  @instrumented
+  async def reload_sheet_data(self, force: bool = False):
+    async with self:
+      self.loading = True
+      page = self.router.page.path
+      nick_name = self.current_user.nick_name if self.current_user else None
+      query = self.search_query
+      user_page = self.user_page
+      order_page = self.order_page
+    try:
+      data = await asyncio.to_thread(
+        load_session_data, force, page, nick_name, query, user_page,
+        order_page
+      )
+    except Exception as e:
+      print(f"Failed to reload sheet data: {e}")
+      async with self:
+        self.loading = False
+      return rx.toast.error("Failed to load data, please try again")
+    async with self:
+      assign(self, data)
+      self.loading = False
+
+  @rx.event(background=True)
+  async def watch_signups(self):
+    """Pushes changed sign-ups to this admin screen while it stays open.
+
+    The watch wakes on each sign-up made by this process, and checks for
+    others every signup_heartbeat_seconds. It ends once the screen was
+    disconnected for signup_grace_seconds, shows another page or started a
+    newer watch. The page starts a new watch each time its connection is
+    back, and the first push of a watch sends all sign-ups.
+    """
+    async with self:
+      self._signup_watch += 1
+      watch = self._signup_watch
+      page = self.router.page.path
+      token = self.router.session.client_token
+    version = None
+    disconnected_at = None
+    while True:
+      if signup_feed.is_connected(token):
+        disconnected_at = None
+      elif disconnected_at is None:
+        disconnected_at = time.monotonic()
+        # The last push may have been lost, so all is sent again
+        version = None
+      elif time.monotonic() - disconnected_at >= signup_grace_seconds:
+        return
+      changed = signup_feed.listen()
+      current = await asyncio.to_thread(signup_version)
+      # Pushes while disconnected would be lost, so they wait for the
+      # screen to be back
+      if current != version and disconnected_at is None:
+        data = await asyncio.to_thread(signup_data, page)
+        async with self:
+          if self._signup_watch != watch or self.router.page.path != page:
+            return
+          assign(self, data, force=version is None)
+        version = current
+      await signup_feed.wait(changed, signup_heartbeat_seconds)
 
   @rx.event
-  def reload_sheet_data(self):
-    print("Reloading sheet data")
-    user_data = user_sheet.get_all_records(expected_headers=[
-      'nick_name', 'first_name', 'last_name', 'phone_number', 'email',
-      'address', 'volunteer', 'away', 'diet', 'allergies', 'owes'
-    ]) 
-    item_data = item_sheet.get_all_records(expected_headers=[
-      'name', 'price', 'description', 'tax_category'
-    ])
-    order_data = order_sheet.get_all_records(expected_headers=[
-      'order_id', 'user', 'time', 'item', 'quantity', 'price', 'total',
-      'diet', 'allergies', 'served', 'tax_category', 'comment'
-    ])
-    self.admin_data = admin_sheet.get_all_records()[0]
-    self.users = [
-      User.from_dict(x) for x in user_data if x['nick_name'] != ''
-    ]
-    self.items = {
-      x['name'] : Item.from_dict(x) for x in item_data if x['name'] != ''
-    }
-    self.orders = [
-      Order.from_dict(x) for x in order_data
-    ]
-    self.users.sort(key=lambda x: x.nick_name)
+  def search_users(self, query: str):
+    self.search_query = query
+    assign(self, user_card_page(query, 0))
+
+  @rx.event
+  def show_user_page(self, page: int):
+    assign(self, user_card_page(self.search_query, page))
 
   @rx.event
-  def redirect_to_user_page(self, user: User):
-    self.current_user = user
+  def show_order_page(self, page: int):
+    assign(self, user_order_page(
+      snapshot_cache.current(), self.current_user.nick_name, page
+    ))
+
+  @rx.event
+  def redirect_to_user_page(self, nick_name: str):
+    self.current_user = user_search.user(nick_name)
+    self.order_page = 0
+    self.search_query = ""
+    self.user_page = 0
     return rx.redirect("/user")
   
   @rx.event
-  def redirect_to_admin_user_page(self, user: User):
-    self.current_user = user
+  def redirect_to_admin_user_page(self, nick_name: str):
+    self.current_user = user_search.user(nick_name)
     return rx.redirect("/admin/user")
 
   @rx.event
@@ -62,13 +293,14 @@ class State(rx.State):
       return rx.redirect("/")
     
   @rx.event
-  def order_item(self, form_data: dict):
-    item = self.items[form_data['item_name']]
+  @instrumented
+  async def order_item(self, form_data: dict):
+    item = snapshot_cache.current().items[form_data['item_name']]
     try:
       quantity = float(form_data['quantity'])
     except:
       return rx.toast.error("Failed to register. Quantity must be a number")
-    order_sheet.append_row([
+    await asyncio.to_thread(order_journal.submit, [
       str(uuid.uuid4()), 
       self.current_user.nick_name,
       str(datetime.now()),
@@ -79,16 +311,17 @@ class State(rx.State):
       "", "", "", "",
       item.tax_category,
       ""
-    ], table_range="A1")
+    ])
     return rx.toast.info(
       f"'{item.name}' registered succesfully. Thank you!",
       position="bottom-center"
     )
   
   @rx.event
-  def order_custom_item(self, form_data: dict):
+  @instrumented
+  async def order_custom_item(self, form_data: dict):
     item_name = form_data['custom_item_name']
-    order_sheet.append_row([
+    await asyncio.to_thread(order_journal.submit, [
       str(uuid.uuid4()), 
       self.current_user.nick_name,
       str(datetime.now()),
@@ -99,19 +332,21 @@ class State(rx.State):
       "", "", "", "",
       form_data['tax_category'],
       form_data['custom_item_description']
-    ], table_range="A1")
+    ])
     return rx.redirect("/user")
   
   @rx.event
-  def order_dinner(self, form_data: dict):
+  @instrumented
+  async def order_dinner(self, form_data: dict):
+    admin_data = snapshot_cache.current().admin_data
     row = [
       str(uuid.uuid4()), 
       self.current_user.nick_name,
       str(datetime.now()),
       "Dinner sign-up",
       1.0,
-      self.admin_data['dinner_price'],
-      self.admin_data['dinner_price'],
+      admin_data['dinner_price'],
+      admin_data['dinner_price'],
       f"{form_data['first_name']} {form_data['last_name']}",
       form_data['diet'],
       form_data['allergies'],
@@ -119,21 +354,24 @@ class State(rx.State):
       "Food and beverage non-alcoholic",
       ""
     ]
-    order_sheet.append_row(row, table_range="A1")
+    await asyncio.to_thread(order_journal.submit, row)
+    signup_feed.notify()
 
     rx.toast.info("Dinner sign-up successful")
     return rx.redirect("/user")
   
   @rx.event
-  def order_dinner_late(self, form_data: dict):
+  @instrumented
+  async def order_dinner_late(self, form_data: dict):
+    admin_data = snapshot_cache.current().admin_data
     row = [
       str(uuid.uuid4()), 
       form_data['nick_name'],
       str(datetime.now()),
       "Dinner sign-up",
       1.0,
-      self.admin_data['dinner_price'],
-      self.admin_data['dinner_price'],
+      admin_data['dinner_price'],
+      admin_data['dinner_price'],
       form_data['full_name'],
       form_data['diet'],
       form_data['allergies'],
@@ -141,14 +379,17 @@ class State(rx.State):
       "Food and beverage non-alcoholic",
       ""
     ]
-    order_sheet.append_row(row, table_range="A1")
+    await asyncio.to_thread(order_journal.submit, row)
+    signup_feed.notify()
     return rx.redirect("/admin/dinner")
 
   @rx.event
-  def order_breakfast(self, form_data: dict):
+  @instrumented
+  async def order_breakfast(self, form_data: dict):
     menu_item = form_data['menu_item']
     key = f"{menu_item}_price"
-    price = self.admin_data[key] if not self.current_user.volunteer else 0.0
+    admin_data = snapshot_cache.current().admin_data
+    price = admin_data[key] if not self.current_user.volunteer else 0.0
     row = [
       str(uuid.uuid4()), 
       self.current_user.nick_name,
@@ -164,145 +405,131 @@ class State(rx.State):
       "Food and beverage non-alcoholic",
       ""
     ]
-    order_sheet.append_row(row, table_range="A1")
+    await asyncio.to_thread(order_journal.submit, row)
+    signup_feed.notify()
     rx.toast.info("Breakfast/pack-lunch sign-up successful")
     return rx.redirect("/user")
   
   @rx.event
-  def submit_signup(self, form_data: dict):
-    user_sheet.append_row(list(form_data.values()), table_range="A1")
+  @instrumented
+  async def submit_signup(self, form_data: dict):
+    row = list(form_data.values())
+    try:
+      await asyncio.to_thread(repository.append_user, row)
+    except SheetsUnavailable:
+      return rx.toast.error(
+        "Sign-up is unavailable right now, please try again in a minute"
+      )
+    except ValueError as e:
+      return rx.toast.error(str(e))
+    user_search.add(user_decoder.decode(User, [row])[0])
+    snapshot_cache.invalidate()
     return rx.redirect("/")
   
-  @rx.var(cache=False)
-  def current_user_orders(self) -> List[Order]:
-    filtered: List[Order] = []
-    for order in self.orders:
-      if order.user_nick_name == self.current_user.nick_name:
-        filtered.append(order)
-    filtered.sort(key=lambda x: x.time, reverse=True)
-    return filtered
+  @rx.event(background=True)
+  @instrumented
+  async def close_period(self, form_data: dict):
+    try:
+      until = date.fromisoformat(form_data['until'])
+    except ValueError:
+      return rx.toast.error("Please pick the first day of the open period")
+    if until > date.today():
+      return rx.toast.error("Only periods that already ended can be closed")
+    async with self:
+      if self.closing:
+        return
+      self.closing = True
+    try:
+      closed = await asyncio.to_thread(repository.close_period, until)
+    except Exception as e:
+      print(f"Failed to close period: {e}")
+      return rx.toast.error(f"Failed to close period: {e}")
+    finally:
+      async with self:
+        self.closing = False
+    await asyncio.to_thread(snapshot_cache.get, True)
+    return rx.toast.info(f"Closed {closed} orders placed before {until}")
+
+  @rx.event(background=True)
+  @instrumented
+  async def run_tax_report(self, form_data: Optional[dict] = None):
+    today = date.today()
+    form_data = value_or(form_data, {})
+    try:
+      start = date.fromisoformat(
+        form_data.get('start') or today.replace(day=1).isoformat()
+      )
+      end = date.fromisoformat(form_data.get('end') or today.isoformat())
+    except ValueError:
+      return rx.toast.error("Please pick a valid date range")
+    period = form_data.get('period') or "month"
+    rows, categories = await asyncio.to_thread(
+      lambda: order_columns.get().report(start, end, period)
+    )
+    async with self:
+      self.tax_report = rows
+      self.tax_categories = categories
+      self.report_start = start.isoformat()
+      self.report_end = end.isoformat()
+      self.report_period = period
+
+  @rx.event
+  def profile_session(self):
+    """Profiles this session's handler runs for a while."""
+    profiler.arm(self.router.session.client_token, profile_trigger_seconds)
+    return rx.toast.info(
+      f"Profiling this session for {profile_trigger_seconds:.0f} seconds, "
+      f"see {profile_dir}"
+    )
+
+  @rx.event
+  def download_tax_report(self):
+    return rx.download(
+      data=report_csv(self.tax_report),
+      filename=f"tax_{self.report_start}_{self.report_end}.csv"
+    )
 
   @rx.var(cache=False)
   def invalid_new_user_name(self) -> bool:
-    return self.new_nick_name in [x.nick_name for x in self.users]
+    with computed_var_seconds.labels("invalid_new_user_name").time():
+      return user_search.user(self.new_nick_name) is not None
   
   @rx.var(cache=False)
   def invalid_custom_item_price(self) -> bool:
-    try:
-      # Convert to float and check decimals
-      float_val = float(self.custom_item_price)
-      # Optionally check decimal places
-      if len(str(float_val).split('.')[-2]) <= 2:  # For 2 decimal places
-        return False
-      return True
-    except ValueError:
-      return True 
+    with computed_var_seconds.labels("invalid_custom_item_price").time():
+      try:
+        # Convert to float and check decimals
+        float_val = float(self.custom_item_price)
+        # Optionally check decimal places
+        if len(str(float_val).split('.')[-2]) <= 2:  # For 2 decimal places
+          return False
+        return True
+      except ValueError:
+        return True 
   
   @rx.var(cache=False)
   def dinner_signup_available(self) -> int:
-    try:
-      deadline = datetime.strptime(self.admin_data['dinner_signup_deadline'], "%H:%M")
-    except:
-      deadline = datetime.strptime("22:59", "%H:%M")
-    now = datetime.now()
-    deadline_minutes = deadline.hour * 60 + deadline.minute
-    now_minutes = now.hour * 60 + now.minute
-    return now_minutes < deadline_minutes
-  
-  @rx.var(cache=False)
-  def breakfast_signup_available(self) -> int:
-    try:
-      deadline = datetime.strptime(self.admin_data['breakfast_signup_deadline'], "%H:%M")
-    except:
-      deadline = datetime.strptime("22:59", "%H:%M")
-    now = datetime.now()
-    deadline_minutes = deadline.hour * 60 + deadline.minute
-    now_minutes = now.hour * 60 + now.minute
-    return now_minutes < deadline_minutes
-  
-  @rx.var(cache=False)
-  def tax_categories(self) -> Dict[str, float]:
-    result: Dict[str, float] = {}
-    for order in self.orders:
-      if not order.tax_category in result:
-        result[order.tax_category] = 0.0
-      result[order.tax_category] += order.price
-    return result
-
-  @rx.var(cache=False)
-  def breakfast_signups(self) -> List[Order]:
-    signups: List[Order] = []
-    for order in self.orders:
+    with computed_var_seconds.labels("dinner_signup_available").time():
+      admin_data = snapshot_cache.current().admin_data
       try:
-        order_date = datetime.fromisoformat(order.time).date()
+        deadline = datetime.strptime(admin_data['dinner_signup_deadline'], "%H:%M")
       except:
-        pass
-      if order.item == "Breakfast sign-up" and \
-          order_date == datetime.today().date():
-        order_alt = order.copy()
-        order_alt.time = datetime.fromisoformat(order.time).strftime("%H:%M:%S")
-        signups.append(order_alt)
-    signups.sort(key=lambda x: x.time, reverse=True)
-    return signups
+        deadline = datetime.strptime("22:59", "%H:%M")
+      now = datetime.now()
+      deadline_minutes = deadline.hour * 60 + deadline.minute
+      now_minutes = now.hour * 60 + now.minute
+      return now_minutes < deadline_minutes
   
   @rx.var(cache=False)
-  def dinner_signups(self) -> List[Order]:
-    signups: List[Order] = []
-    for order in self.orders:
+  def breakfast_signup_available(self) -> int:
+    with computed_var_seconds.labels("breakfast_signup_available").time():
+      admin_data = snapshot_cache.current().admin_data
       try:
-        order_date = datetime.fromisoformat(order.time).date()
+        deadline = datetime.strptime(admin_data['breakfast_signup_deadline'], "%H:%M")
       except:
-        pass
-      if order.item == "Dinner sign-up" and \
-          order_date == datetime.today().date():
-        signups.append(order)
-    for user in self.users:
-      if user.volunteer:
-        signups.append(Order(order_id="",
-          user_nick_name=user.nick_name, time="",
-          item="Dinner sign-up (volunteer)",
-          quantity=1.0, price=0.0, total=0.0,
-          receiver=user.full_name, diet=user.diet,
-          allergies=user.allergies, served="", tax_category="",
-          comment="yes"
-        ))
-    signups.sort(key=lambda x: x.receiver)    
-    signups.sort(key=lambda x: x.diet)    
-    signups.sort(key=lambda x: x.comment)    
-    return signups
-  
-  @rx.var(cache=False)
-  def dinner_count(self) -> int:
-    return len(self.dinner_signups)
-  
-  @rx.var(cache=False)
-  def dinner_count_vegan(self) -> int:
-    count = 0
-    for order in self.dinner_signups:
-      if order.diet == "Vegan":
-        count += 1
-    return count
-  
-  @rx.var(cache=False)
-  def dinner_count_vegetarian(self) -> int:
-    count = 0
-    for order in self.dinner_signups:
-      if order.diet == "Vegetarian":
-        count += 1
-    return count
-  
-  @rx.var(cache=False)
-  def dinner_count_meat(self) -> int:
-    count = 0
-    for order in self.dinner_signups:
-      if order.diet == "Meat":
-        count += 1
-    return count
-  
-  @rx.var(cache=False)
-  def get_user_debt(self) -> float:
-    return sum([order.total for order in self.current_user_orders])
-  
-  @rx.var(cache=False)
-  def get_all_nick_names(self) -> List[str]:
-    return [user.nick_name for user in self.users]
+        deadline = datetime.strptime("22:59", "%H:%M")
+      now = datetime.now()
+      deadline_minutes = deadline.hour * 60 + deadline.minute
+      now_minutes = now.hour * 60 + now.minute
+      return now_minutes < deadline_minutes
+  
\ No newline at end of file
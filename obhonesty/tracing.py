@@ -0,0 +1,195 @@
+"""Span tracing from the websocket event down to the Sheets calls.
+
+Spans are written one per line in the Chrome trace event format, so
+joining a file into an array, e.g. with jq -s '{traceEvents: .}', gives a
+trace that Perfetto or chrome://tracing can open. Each trace gets its own
+track; the ids and attributes of a span are in its args.
+
+An event's trace has these spans:
+- event: from receiving the event until its updates were sent
+- lock_state: waiting for the session's state, at dispatch and in each
+  async with self of a background handler
+- the handler itself, and the functions it calls that are traced
+- sheets: each call to Google, retries apart
+- emit_update: serializing a state update and queueing it on the socket
+
+What is left of the event between the handler and emit_update is reflex
+computing the delta.
+"""
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from reflex.middleware import Middleware
+
+from obhonesty.constants import trace_backups, trace_max_bytes, trace_path
+
+class Span:
+
+  def __init__(
+    self, name: str, kind: str, parent: Optional["Span"],
+    attributes: Dict[str, Any]
+  ):
+    self.name = name
+    self.kind = kind
+    self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+    self.span_id = os.urandom(8).hex()
+    self.parent_id = parent.span_id if parent else None
+    self.attributes = attributes
+    self.start = time.time()
+    self.started = time.perf_counter()
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar(
+  "current_span", default=None
+)
+
+
+class Tracer:
+  """Writes spans to a rotating file from a background thread."""
+
+  def __init__(self, path: str, max_bytes: int, backups: int):
+    self.enabled = path != ""
+    self.pid = os.getpid()
+    self.logger = logging.getLogger("obhonesty.trace")
+    self.logger.propagate = False
+    self.logger.setLevel(logging.INFO)
+    if self.enabled:
+      records: queue.SimpleQueue = queue.SimpleQueue()
+      handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups
+      )
+      self.logger.addHandler(QueueHandler(records))
+      self.listener = QueueListener(records, handler)
+      self.listener.start()
+
+  def start(self, name: str, kind: str, **attributes) -> Span:
+    return Span(name, kind, current_span.get(), attributes)
+
+  def end(self, span: Span):
+    duration = time.perf_counter() - span.started
+    self.logger.info(json.dumps({
+      "name": span.name,
+      "cat": span.kind,
+      "ph": "X",
+      "ts": round(span.start * 1e6),
+      "dur": round(duration * 1e6),
+      "pid": self.pid,
+      "tid": int(span.trace_id[:8], 16),
+      "args": {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "thread": threading.current_thread().name,
+        **span.attributes
+      }
+    }, default=str))
+
+  @contextmanager
+  def span(
+    self, name: str, kind: str, **attributes
+  ) -> Iterator[Optional[Span]]:
+    """Runs the block in a span that the spans started in it belong to."""
+    if not self.enabled:
+      yield None
+      return
+    span = self.start(name, kind, **attributes)
+    token = current_span.set(span)
+    try:
+      yield span
+    except BaseException as e:
+      span.attributes["error"] = repr(e)
+      raise
+    finally:
+      current_span.reset(token)
+      self.end(span)
+
+  def traced(
+    self, kind: str
+  ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Runs each call of the function in a span named after it."""
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+      if not self.enabled:
+        return fn
+      name = fn.__name__
+      if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def run(*args, **kwargs):
+          with self.span(name, kind):
+            return await fn(*args, **kwargs)
+      else:
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+          with self.span(name, kind):
+            return fn(*args, **kwargs)
+      return run
+    return decorate
+
+  async def instrument(self, app: Any):
+    """Traces the app's event dispatch, state locking and updates.
+
+    The socket namespace only exists once the pages were compiled, which
+    may still be going on when the server starts, so this waits for it.
+    """
+    while app.event_namespace is None:
+      await asyncio.sleep(0.1)
+    namespace = app.event_namespace
+    on_event = namespace.on_event
+    emit_update = namespace.emit_update
+    modify_state = app.modify_state
+
+    async def traced_on_event(sid: str, data: Any):
+      name = data.get("name", "") if isinstance(data, dict) else ""
+      with self.span("event", "event", event=name.rpartition(".")[2]):
+        await on_event(sid, data)
+
+    async def traced_emit_update(update: Any, sid: str):
+      with self.span("emit_update", "emit", final=update.final):
+        await emit_update(update, sid)
+
+    @asynccontextmanager
+    async def traced_modify_state(token: str):
+      span = self.start("lock_state", "lock")
+      async with modify_state(token) as state:
+        self.end(span)
+        yield state
+
+    namespace.on_event = traced_on_event
+    namespace.emit_update = traced_emit_update
+    app.modify_state = traced_modify_state
+
+  def install(self, app: Any):
+    """Traces the app's events, if tracing is on."""
+    if self.enabled:
+      app.add_middleware(TraceMiddleware())
+      app.register_lifespan_task(lambda: self.instrument(app))
+
+
+class TraceMiddleware(Middleware):
+  """Records the wait for the session's state at dispatch.
+
+  Reflex calls preprocess once it holds the state, so the wait is the time
+  since the event span started.
+  """
+
+  async def preprocess(self, app: Any, state: Any, event: Any) -> None:
+    event_span = current_span.get()
+    if event_span is not None and event_span.kind == "event":
+      span = Span("lock_state", "lock", event_span, {})
+      span.start, span.started = event_span.start, event_span.started
+      tracer.end(span)
+    return None
+
+
+tracer = Tracer(trace_path, trace_max_bytes, trace_backups)
+traced = tracer.traced
@@ -1,4 +1,3 @@
-from typing import Dict
 import reflex as rx
 
 class User(rx.Base):
@@ -12,23 +11,14 @@ class User(rx.Base):
   away: bool
   diet: str
   allergies: str
+  owes: float = 0.0
 
   @property
   def full_name(self) -> str:
      return f"{self.first_name} {self.last_name}"
 
-  @staticmethod
-  def from_dict(x: Dict[str, str]):
-    return User(
-      nick_name=x['nick_name'],
-      first_name=x['first_name'],
-      last_name=x['last_name'],
-      email=x['email'],
-      phone_number=x['phone_number'],
-      address=x['address'],
-      volunteer=x['volunteer'] == 'yes',
-      away=x['away'] == 'yes',
-      diet=x['diet'],
-      allergies=x['allergies']
-    )
 
+class UserCard(rx.Base):
+  """The part of a user shown in the user lists."""
+  nick_name: str
+  full_name: str